@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Lower priority values are admitted first; ADMISSION_MODES (JSON with the same shape) is merged in per mode
+DEFAULT_ADMISSION_MODES = {
+    "glossary": {"priority": 0, "max_concurrency": 16, "max_queue": 128},
+    "simple": {"priority": 1, "max_concurrency": 8, "max_queue": 64},
+    "standard": {"priority": 1, "max_concurrency": 8, "max_queue": 64},
+    "compare": {"priority": 2, "max_concurrency": 4, "max_queue": 32},
+    "technical": {"priority": 2, "max_concurrency": 4, "max_queue": 32},
+}
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class ModeLimit:
+    def __init__(self, name: str, priority: int, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queued = 0
+        self.wait = LatencyTracker()
+        self.service = LatencyTracker()
+        self.stats = {"admitted": 0, "queue_full": 0, "client_limited": 0, "timed_out": 0}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "priority": self.priority,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            **self.stats,
+            "wait_p50_ms": round(self.wait.percentile(0.5) * 1000, 1),
+            "wait_p95_ms": round(self.wait.percentile(0.95) * 1000, 1),
+            "service_p50_ms": round(self.service.percentile(0.5) * 1000, 1)
+        }
+
+class Waiter:
+    def __init__(self, mode: ModeLimit, client: str, sub_client: tuple, sequence: int):
+        self.mode = mode
+        self.client = client
+        self.sub_client = sub_client
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+class AdmissionController:
+    # Runs on the event loop; every method is called from that single thread, so no locks are needed
+    def __init__(self):
+        override = json.loads(os.getenv("ADMISSION_MODES", "null")) or {}
+        config = {
+            name: {**DEFAULT_ADMISSION_MODES.get(name, {}), **override.get(name, {})}
+            for name in {**DEFAULT_ADMISSION_MODES, **override}
+        }
+        self.modes = {
+            name: ModeLimit(name, int(mode.get("priority", 1)), int(mode.get("max_concurrency", 8)), int(mode.get("max_queue", 64)))
+            for name, mode in config.items()
+        }
+        # Unknown modes are admitted as standard, so it has to exist
+        if "standard" not in self.modes:
+            raise ValueError("ADMISSION_MODES must keep a 'standard' mode")
+        # Shared by all modes; keep it at or below the server's worker thread pool (40 by default)
+        self.max_concurrency = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+        self.max_wait = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+        self.max_queued_per_client = int(os.getenv("ADMISSION_MAX_QUEUED_PER_CLIENT", "16"))
+        self.in_flight = 0
+        self.waiters = []
+        self.client_queued = {}
+        self.client_in_flight = {}
+        self.sub_client_in_flight = {}
+        self._sequence = itertools.count()
+
+    def _mode(self, mode: str) -> ModeLimit:
+        return self.modes.get(mode) or self.modes["standard"]
+
+    def _can_run(self, mode: ModeLimit) -> bool:
+        return self.in_flight < self.max_concurrency and mode.in_flight < mode.max_concurrency
+
+    def _retry_after(self, mode: ModeLimit) -> int:
+        # Time for the queue ahead to drain at the mode's current service rate
+        service = mode.service.percentile(0.5) or 1.0
+        return max(1, min(60, round((mode.queued + 1) * service / max(1, mode.max_concurrency))))
+
+    @asynccontextmanager
+    async def admit(self, mode_name: str, client: str, sub_client: str = None):
+        # client is the trusted identity the limits apply to; sub_client only breaks ties within it
+        mode = self._mode(mode_name)
+        sub_client = (client, sub_client)
+        await self._acquire(mode, client, sub_client)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            mode.service.record(time.monotonic() - started)
+            self._release(mode, client, sub_client)
+
+    async def _acquire(self, mode: ModeLimit, client: str, sub_client: tuple):
+        # Queue limits only apply to requests that would actually have to wait
+        ahead = any(w.mode.priority <= mode.priority and w.mode.in_flight < w.mode.max_concurrency for w in self.waiters)
+        if ahead or not self._can_run(mode):
+            if mode.queued >= mode.max_queue:
+                mode.stats["queue_full"] += 1
+                raise AdmissionRejected(503, f"The {mode.name} queue is full", self._retry_after(mode))
+            if self.client_queued.get(client, 0) >= self.max_queued_per_client:
+                mode.stats["client_limited"] += 1
+                raise AdmissionRejected(429, "Too many queued requests from this client", self._retry_after(mode))
+
+        waiter = Waiter(mode, client, sub_client, next(self._sequence))
+        self.waiters.append(waiter)
+        mode.queued += 1
+        self.client_queued[client] = self.client_queued.get(client, 0) + 1
+        self._dispatch()
+
+        if not waiter.future.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                if not waiter.future.done():
+                    self._dequeue(waiter)
+                    mode.stats["timed_out"] += 1
+                    raise AdmissionRejected(503, f"Timed out waiting for a {mode.name} slot", self._retry_after(mode))
+            except asyncio.CancelledError:
+                # The client went away; hand the slot on if it had already been granted
+                if waiter.future.done():
+                    self._release(mode, client, sub_client)
+                else:
+                    self._dequeue(waiter)
+                raise
+        mode.wait.record(time.monotonic() - waiter.enqueued_at)
+
+    def _start(self, mode: ModeLimit, client: str, sub_client: tuple):
+        self.in_flight += 1
+        mode.in_flight += 1
+        mode.stats["admitted"] += 1
+        self.client_in_flight[client] = self.client_in_flight.get(client, 0) + 1
+        self.sub_client_in_flight[sub_client] = self.sub_client_in_flight.get(sub_client, 0) + 1
+
+    def _dequeue(self, waiter: Waiter):
+        self.waiters.remove(waiter)
+        waiter.mode.queued -= 1
+        remaining = self.client_queued.get(waiter.client, 1) - 1
+        if remaining:
+            self.client_queued[waiter.client] = remaining
+        else:
+            self.client_queued.pop(waiter.client, None)
+
+    def _release(self, mode: ModeLimit, client: str, sub_client: tuple):
+        self.in_flight -= 1
+        mode.in_flight -= 1
+        for counts, key in ((self.client_in_flight, client), (self.sub_client_in_flight, sub_client)):
+            remaining = counts.get(key, 1) - 1
+            if remaining:
+                counts[key] = remaining
+            else:
+                counts.pop(key, None)
+        self._dispatch()
+
+    def _dispatch(self):
+        # Highest priority first; within a priority, the client with the fewest requests running, then the
+        # sub-client with the fewest, then arrival order
+        while self.waiters and self.in_flight < self.max_concurrency:
+            runnable = [w for w in self.waiters if w.mode.in_flight < w.mode.max_concurrency]
+            if not runnable:
+                return
+            waiter = min(runnable, key=lambda w: (
+                w.mode.priority, self.client_in_flight.get(w.client, 0), self.sub_client_in_flight.get(w.sub_client, 0), w.sequence
+            ))
+            self._dequeue(waiter)
+            self._start(waiter.mode, waiter.client, waiter.sub_client)
+            waiter.future.set_result(True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "queued_clients": len(self.client_queued),
+            "modes": {name: mode.get_stats() for name, mode in self.modes.items()}
+        }
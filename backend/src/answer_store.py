@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Modes that are precomputed for every glossary term
+PRECOMPUTED_MODES = ("glossary", "simple", "standard")
+
+QUESTION_PREFIX = re.compile(
+    r"^(what\s+(is|are|does)\s+(an?\s+|the\s+)?|what's\s+(an?\s+|the\s+)?|define\s+|definition\s+of\s+|"
+    r"meaning\s+of\s+|explain\s+(what\s+)?)"
+)
+QUESTION_SUFFIX = re.compile(r"\s+(stand\s+for|mean|means|is)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    term_id TEXT PRIMARY KEY,
+    term TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    term_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aliases_term ON aliases (term_id);
+CREATE TABLE IF NOT EXISTS answers (
+    term_id TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    generated_at REAL NOT NULL,
+    PRIMARY KEY (term_id, mode)
+);
+"""
+
+def normalize_key(text: str) -> str:
+    text = re.sub(r"[^\w\s&/\-]", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+def term_aliases(term: str) -> List[str]:
+    # "HCPCS (Healthcare Common Procedure Coding System)" -> full header, acronym and expansion
+    aliases = {normalize_key(term)}
+    match = re.match(r"^(.*?)\s*\((.*)\)\s*$", term)
+    if match:
+        aliases.add(normalize_key(match.group(1)))
+        aliases.add(normalize_key(match.group(2)))
+    return [alias for alias in aliases if alias]
+
+def question_key(question: str) -> str:
+    key = normalize_key(question)
+    key = QUESTION_PREFIX.sub("", key)
+    return QUESTION_SUFFIX.sub("", key).strip()
+
+def definition_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class AnswerStore:
+    def __init__(self, path: str = None, read_only: bool = True):
+        self.path = path or os.getenv("ANSWER_STORE_PATH", "../data/answers.db")
+        self.read_only = read_only
+        self._local = threading.local()
+        self.stats = {"hits": 0, "misses": 0}
+
+        if not read_only:
+            with self._connection() as connection:
+                connection.executescript(SCHEMA)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        # sqlite connections are per thread; query workers open the file read-only
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.read_only:
+                if not os.path.exists(self.path):
+                    return None
+                connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            else:
+                connection = sqlite3.connect(self.path)
+                connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def lookup(self, question: str, mode: str) -> Optional[Dict[str, Any]]:
+        if mode not in PRECOMPUTED_MODES:
+            return None
+
+        try:
+            connection = self._connection()
+            if connection is None:
+                return None
+
+            row = connection.execute(
+                "SELECT answers.answer, answers.sources FROM aliases "
+                "JOIN answers ON answers.term_id = aliases.term_id "
+                "WHERE aliases.alias = ? AND answers.mode = ?",
+                (question_key(question), mode)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading answer store: {e}")
+            return None
+
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        return {"answer": row[0], "sources": json.loads(row[1])}
+
+    def term_hashes(self) -> Dict[str, str]:
+        rows = self._connection().execute("SELECT term_id, source_hash FROM terms").fetchall()
+        return dict(rows)
+
+    def missing_modes(self, term_id: str) -> List[str]:
+        rows = self._connection().execute("SELECT mode FROM answers WHERE term_id = ?", (term_id,)).fetchall()
+        present = {row[0] for row in rows}
+        return [mode for mode in PRECOMPUTED_MODES if mode not in present]
+
+    def upsert_term(self, term: str, source_hash: str):
+        term_id = normalize_key(term)
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO terms (term_id, term, source_hash, updated_at) VALUES (?, ?, ?, ?)",
+                (term_id, term, source_hash, time.time())
+            )
+            connection.execute("DELETE FROM aliases WHERE term_id = ?", (term_id,))
+            connection.executemany(
+                "INSERT OR REPLACE INTO aliases (alias, term_id) VALUES (?, ?)",
+                [(alias, term_id) for alias in term_aliases(term)]
+            )
+
+    def put_answer(self, term: str, mode: str, answer: str, sources: List[str]):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO answers (term_id, mode, answer, sources, generated_at) VALUES (?, ?, ?, ?, ?)",
+                (normalize_key(term), mode, answer, json.dumps(sources), time.time())
+            )
+
+    def invalidate(self, term_id: str):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM answers WHERE term_id = ?", (term_id,))
+
+    def delete_term(self, term_id: str):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM answers WHERE term_id = ?", (term_id,))
+            connection.execute("DELETE FROM aliases WHERE term_id = ?", (term_id,))
+            connection.execute("DELETE FROM terms WHERE term_id = ?", (term_id,))
@@ -0,0 +1,120 @@
+import time
+import queue
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Batch sizes are reported in power-of-two buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+class EmbeddingBatcher:
+    def __init__(self, embed_batch: Callable[[List[str]], List[List[float]]], window_ms: float = 5.0,
+                 max_batch: int = 32, max_in_flight: int = 8):
+        self.embed_batch = embed_batch
+        # Longer windows make bigger batches at the cost of up to window_ms added latency
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.enabled = self.window > 0 and self.max_batch > 1
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        # A batch is only handed to the pool once a call slot is free, so the pool's queue never grows
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.queue_wait = LatencyTracker()
+        self.batch_sizes = Counter()
+        self.stats = {"requests": 0, "batches": 0, "deduplicated": 0, "errors": 0, "slot_waits": 0}
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue()
+
+        if self.enabled:
+            threading.Thread(target=self._dispatch, name="embedding-batcher", daemon=True).start()
+
+    def embed(self, text: str) -> List[float]:
+        with self._stats_lock:
+            self.stats["requests"] += 1
+
+        if not self.enabled:
+            return self.embed_batch([text])[0]
+
+        future = Future()
+        self._queue.put((text, time.monotonic(), future))
+        return future.result()
+
+    def _dispatch(self):
+        while True:
+            # Block for the first request, then collect more until the window closes or the batch fills
+            pending = [self._queue.get()]
+            closes_at = time.monotonic() + self.window
+            while len(pending) < self.max_batch:
+                remaining = closes_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # While every slot is busy the batch keeps filling instead of queuing another call behind them
+            if not self._slots.acquire(blocking=False):
+                with self._stats_lock:
+                    self.stats["slot_waits"] += 1
+                while not self._slots.acquire(blocking=False):
+                    if len(pending) >= self.max_batch:
+                        self._slots.acquire()
+                        break
+                    try:
+                        pending.append(self._queue.get(timeout=self.window))
+                    except queue.Empty:
+                        pass
+
+            # The call runs in the pool so the next batch can start collecting right away
+            self.executor.submit(self._run, pending)
+
+    def _run(self, pending: List[tuple]):
+        try:
+            self._embed(pending)
+        finally:
+            self._slots.release()
+
+    def _embed(self, pending: List[tuple]):
+        dispatched_at = time.monotonic()
+        for _, enqueued_at, _ in pending:
+            self.queue_wait.record(dispatched_at - enqueued_at)
+
+        # Concurrent users often ask the same thing; each distinct text is embedded once
+        texts = list(dict.fromkeys(text for text, _, _ in pending))
+        bucket = next((size for size in BATCH_SIZE_BUCKETS if len(texts) <= size), BATCH_SIZE_BUCKETS[-1])
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["deduplicated"] += len(pending) - len(texts)
+            self.batch_sizes[bucket] += 1
+
+        try:
+            vectors = dict(zip(texts, self.embed_batch(texts)))
+        except Exception as e:
+            with self._stats_lock:
+                self.stats["errors"] += 1
+            for _, _, future in pending:
+                future.set_exception(e)
+            return
+
+        for text, _, future in pending:
+            future.set_result(vectors[text])
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+            batch_sizes = {f"<={size}": self.batch_sizes[size] for size in BATCH_SIZE_BUCKETS if self.batch_sizes[size]}
+        return {
+            **stats,
+            "window_ms": round(self.window * 1000, 2),
+            "max_batch": self.max_batch,
+            "mean_batch_size": round((stats["requests"] - stats["deduplicated"]) / stats["batches"], 2) if stats["batches"] else 0.0,
+            "batch_sizes": batch_sizes,
+            "queue_wait_p50_ms": round(self.queue_wait.percentile(0.5) * 1000, 2),
+            "queue_wait_p95_ms": round(self.queue_wait.percentile(0.95) * 1000, 2)
+        }
@@ -0,0 +1,152 @@
+import time
+import argparse
+import multiprocessing
+import logging
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from index_store import IndexStore, IndexSnapshot
+from quantization import VECTOR_PRECISIONS
+
+logger = logging.getLogger(__name__)
+
+def synthetic_generation(root: Path, rows: int, dimensions: int, clusters: int, seed: int) -> Path:
+    # Clustered vectors resemble real embeddings better than uniform noise, where every pair is near-orthogonal
+    generator = np.random.default_rng(seed)
+    centers = generator.normal(size=(clusters, dimensions)).astype(np.float32)
+    labels = generator.integers(0, clusters, size=rows)
+    vectors = centers[labels] + 0.6 * generator.normal(size=(rows, dimensions)).astype(np.float32)
+    documents = [Document(page_content=f"synthetic chunk {i}", metadata={"chunk_id": str(i)}) for i in range(rows)]
+
+    store = IndexStore(root)
+    _, path = store.create_generation()
+    store.write_snapshot(path, documents, vectors)
+    return path
+
+def chunk_key(doc: Document) -> str:
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+def proportional_set_size() -> dict:
+    # Pss splits each shared page between the processes mapping it, so summing it over workers counts the page cache once.
+    # Anon is private to each worker; file is mmap'd index pages shared through the page cache
+    sizes = {}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                if line.startswith(("Pss_Anon:", "Pss_File:")):
+                    sizes[line.split(":")[0][4:].lower()] = int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return sizes if len(sizes) == 2 else None
+
+def worker_memory(path: Path, precision: str, factor: int, queries: np.ndarray, k: int, barrier, results):
+    before = proportional_set_size()
+    snapshot = IndexSnapshot(path, precision=precision, rescore_factor=factor)
+    for query in queries:
+        snapshot.search(query, k)
+    # Measure while every worker still maps the index, then exit together
+    barrier.wait()
+    after = proportional_set_size()
+    results.put(None if before is None or after is None else {kind: after[kind] - before[kind] for kind in after})
+    barrier.wait()
+
+def workers_memory(path: Path, precision: str, factor: int, queries: np.ndarray, k: int, workers: int) -> dict:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker_memory, args=(path, precision, factor, queries, k, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    if None in samples:
+        return None
+    return {kind: sum(sample[kind] for sample in samples) for kind in ("anon", "file")}
+
+def benchmark(path: Path, queries: int, k: int, rescore_factors: list, noise: float, seed: int, workers: int) -> list:
+    exact = IndexSnapshot(path, precision="float32")
+    generator = np.random.default_rng(seed)
+
+    # Queries are stored vectors nudged off their row, like a paraphrase of an indexed chunk
+    rows = generator.integers(0, len(exact), size=queries)
+    query_vectors = np.asarray(exact.vectors[rows]) + noise * generator.normal(size=(queries, exact.vectors.shape[1])).astype(np.float32)
+    truth = [{chunk_key(doc) for doc, _ in exact.search(query, k)} for query in query_vectors]
+    # Pages still mapped here would be shared with the workers and understate their memory
+    del exact
+
+    results = []
+    configurations = [("float32", 1)] + [(p, f) for p in VECTOR_PRECISIONS if p != "float32" for f in rescore_factors]
+    for precision, factor in configurations:
+        memory = workers_memory(path, precision, factor, query_vectors, k, workers) if workers else None
+
+        snapshot = IndexSnapshot(path, precision=precision, rescore_factor=factor)
+        latencies = []
+        hits = 0
+        for query, expected in zip(query_vectors, truth):
+            started = time.perf_counter()
+            found = snapshot.search(query, k)
+            latencies.append(time.perf_counter() - started)
+            hits += len(expected & {chunk_key(doc) for doc, _ in found})
+
+        scanned = snapshot.compact.nbytes if snapshot.compact is not None else snapshot.vectors.nbytes
+        results.append({
+            "precision": precision,
+            "rescore_factor": factor if precision != "float32" else "-",
+            f"recall@{k}": round(hits / (len(truth) * k), 4),
+            "scanned_mb": round(scanned / 2 ** 20, 2),
+            f"anon_mb_{workers}w": round(memory["anon"] / 2 ** 20, 2) if memory else "-",
+            f"file_mb_{workers}w": round(memory["file"] / 2 ** 20, 2) if memory else "-",
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3)
+        })
+        del snapshot
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k versus memory and latency for float32, float16 and int8 index vectors")
+    parser.add_argument("--generation", help="index generation directory to benchmark (default: the current one)")
+    parser.add_argument("--synthetic", type=int, metavar="ROWS", help="benchmark a generated index with this many rows instead")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--rescore-factors", default="1,2,4,8")
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=4, help="worker processes sharing the index for the memory measurement (0 to skip)")
+    args = parser.parse_args()
+
+    rescore_factors = [int(factor) for factor in args.rescore_factors.split(",")]
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.synthetic:
+            path = synthetic_generation(Path(scratch), args.synthetic, args.dimensions, args.clusters, args.seed)
+        elif args.generation:
+            path = Path(args.generation)
+        else:
+            store = IndexStore()
+            generation = store.current_generation()
+            if generation is None:
+                parser.error("No current index generation; pass --generation or --synthetic")
+            path = store.generation_path(generation)
+
+        results = benchmark(path, args.queries, args.k, rescore_factors, args.noise, args.seed, args.workers)
+
+    columns = list(results[0])
+    print("  ".join(f"{column:>16}" for column in columns))
+    for row in results:
+        print("  ".join(f"{str(row[column]):>16}" for column in columns))
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,69 @@
+import os
+import time
 import logging
-from typing import Dict, List, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
 
 from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
 from langchain_core.prompts import PromptTemplate
 
 from retriever import HealthcareRetriever
+from extractive import ExtractiveAnswerer
+from resilience import ResilientCaller, CircuitBreaker, CircuitOpenError, SaturatedError
+from routing import ModelRouter
+from answer_store import AnswerStore
+from provider_client import get_provider_clients
+from sessions import Session
+from tracing import get_tracer
 
 logger = logging.getLogger(__name__)
 
+# Per-attempt LLM timeouts in seconds, overridable with LLM_TIMEOUT_<MODE>
+MODE_TIMEOUTS = {
+    "glossary": 8.0,
+    "simple": 15.0,
+    "standard": 15.0,
+    "technical": 25.0,
+    "compare": 20.0,
+}
+
 class HealthcareQAChain:
-    def __init__(self, model_name: str = "gpt-4.1-nano"):
-        self.llm = ChatOpenAI(model_name=model_name, temperature=0.1)
-        self.retriever_instance = HealthcareRetriever()
+    def __init__(self, model_name: str = "gpt-4.1-nano", retriever: HealthcareRetriever = None, answer_store: AnswerStore = None):
+        mode_timeouts = {
+            mode: float(os.getenv(f"LLM_TIMEOUT_{mode.upper()}", timeout))
+            for mode, timeout in MODE_TIMEOUTS.items()
+        }
+        llm_timeout = max(mode_timeouts.values())
+        # Each request is routed to a model tier by mode and complexity; all tiers share one connection pool
+        self.provider_clients = get_provider_clients()
+        self.router = ModelRouter(
+            lambda model: ChatOpenAI(
+                model_name=model, temperature=0.1, max_retries=0, timeout=llm_timeout,
+                **self.provider_clients.client_kwargs()
+            ),
+            default_model=model_name
+        )
+        self.llm = self.router.tiers[self.router.tier_order[0]].llm
+        # Share the app's retriever so each process holds a single index
+        self.retriever_instance = retriever or HealthcareRetriever()
+        # Answers generated offline by precompute.py for every glossary term
+        self.answer_store = answer_store
+        
+        # Per-request latency budget; past it the LLM-free extractive answer is returned
+        self.deadline_seconds = float(os.getenv("ANSWER_DEADLINE_SECONDS", "20"))
+        self.executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_MAX_WORKERS", "32")))
+        
+        # One breaker per provider, shared by every mode
+        self.llm_breaker = CircuitBreaker("llm")
+        self.llm_callers = {
+            mode: ResilientCaller(f"llm_{mode}", timeout=timeout, executor=self.executor, breaker=self.llm_breaker)
+            for mode, timeout in mode_timeouts.items()
+        }
+        # Built on the first fallback, and rebuilt by one caller at a time when the corpus changes
+        self.extractive = ExtractiveAnswerer()
+        self._extractive_lock = threading.Lock()
         
         # Define prompts for different modes
         self.standard_prompt = PromptTemplate(
@@ -96,169 +147,128 @@ class HealthcareQAChain:
             input_variables=["context", "question"]
         )
     
-    def get_answer(self, question: str) -> Dict[str, Any]:
+    def get_answer(self, question: str, filters: Dict[str, str] = None, deadline: float = None, session: Session = None) -> Dict[str, Any]:
+        return self._answer(question, self.standard_prompt, filters, deadline, "standard", "Error getting answer", session)
+    
+    def get_simple_answer(self, question: str, filters: Dict[str, str] = None, deadline: float = None, session: Session = None) -> Dict[str, Any]:
+        return self._answer(question, self.simple_prompt, filters, deadline, "simple", "Error getting simple answer", session)
+    
+    def get_technical_answer(self, question: str, filters: Dict[str, str] = None, deadline: float = None, session: Session = None) -> Dict[str, Any]:
+        return self._answer(question, self.technical_prompt, filters, deadline, "technical", "Error getting technical answer", session)
+    
+    def get_definition(self, term: str, filters: Dict[str, str] = None, deadline: float = None, session: Session = None) -> Dict[str, Any]:
+        return self._answer(term, self.glossary_prompt, filters, deadline, "glossary", "Error getting definition", session)
+    
+    def _answer(self, question: str, prompt: PromptTemplate, filters: Dict[str, str], deadline: float, mode: str, error_message: str, session: Session = None) -> Dict[str, Any]:
+        result = self._answer_once(question, prompt, filters, deadline, mode, error_message, session)
+        if session is not None:
+            session.add_turn(question, result["answer"])
+        return result
+    
+    def _answer_once(self, question: str, prompt: PromptTemplate, filters: Dict[str, str], deadline: float, mode: str, error_message: str, session: Session) -> Dict[str, Any]:
+        follow_up = session is not None and bool(session.turns)
         try:
+            # Precomputed answers cover the whole corpus, so filtered questions and follow-ups skip them
+            if self.answer_store is not None and not filters and not follow_up:
+                stored = self.answer_store.lookup(question, mode)
+                if stored is not None:
+                    return {**stored, "extractive": False, "precomputed": True}
+            
             # Check if retriever is initialized
             if not self.retriever_instance.initialized or self.retriever_instance.retriever is None:
                 # Try to reinitialize the retriever
                 logger.warning("Retriever not initialized, attempting to reinitialize...")
                 if not self.retriever_instance.initialize_sync():
-                    # Fallback mode - basic healthcare info without vector search
+                    # Fallback mode - extractive answer without vector search or LLM
                     return self._get_fallback_answer(question)
             
-            # Double-check retriever is available
-            if self.retriever_instance.retriever is None:
-                return {
-                    "answer": "I'm sorry, the document retrieval system is not available. Please check the system configuration.",
-                    "sources": []
-                }
-            
-            # Create RetrievalQA chain
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.retriever_instance.retriever,
-                chain_type_kwargs={"prompt": self.standard_prompt},
-                return_source_documents=True
-            )
-            
-            # Get answer
-            result = qa_chain.invoke({"query": question})
-            
-            # Extract sources
-            sources = []
-            for doc in result.get("source_documents", []):
-                source = doc.metadata.get("source", "Unknown")
-                if source not in sources:
-                    sources.append(source)
+            # Retrieve first so the router can size the model to the context
+            started = time.monotonic()
+            tracer = get_tracer()
+            with tracer.span("retrieval", filters=sorted(filters or {}), follow_up=follow_up) as span:
+                # Depth adapts to the scores, so easy questions stuff fewer chunks into the prompt
+                if session is not None:
+                    # Chunks the session already holds are reused; only the missing ones are searched for
+                    generation, cached = session.cached_chunks()
+                    generation, results, searched = self.retriever_instance.retrieve_incremental(
+                        session.retrieval_query(question), mode, filters, cached, generation
+                    )
+                    session.add_chunks(generation, results, searched)
+                    documents = [doc for _, doc, _ in results]
+                    span.set(reused=sum(1 for row, doc, _ in results if cached.get(row) is doc), searched=searched)
+                else:
+                    documents = [doc for doc, _ in self.retriever_instance.retrieve_adaptive(question, mode, filters)]
+                span.set(documents=len(documents))
+            
+            with tracer.span("context_assembly") as span:
+                prompt_question = session.prompt_question(question) if follow_up else question
+                span.set(
+                    documents=len(documents),
+                    context_chars=sum(len(doc.page_content) for doc in documents),
+                    question_chars=len(prompt_question)
+                )
+            
+            # Get answer, or the extractive one if the LLM misses the deadline
+            result = self._generate(mode, prompt, prompt_question, documents, deadline, started, routing_question=question)
+            if result is None:
+                return self._get_fallback_answer(question)
             
             return {
                 "answer": result["result"],
-                "sources": sources
+                "sources": self._extract_sources(result),
+                "extractive": False
             }
             
         except Exception as e:
-            logger.error(f"Error getting answer: {e}")
-            return {
-                "answer": "I'm sorry, I encountered an error while processing your question.",
-                "sources": []
-            }
+            logger.error(f"{error_message}: {e}")
+            return self._get_fallback_answer(question)
     
-    def get_simple_answer(self, question: str) -> Dict[str, Any]:
-        try:
-            # Check if retriever is initialized
-            if not self.retriever_instance.initialized or self.retriever_instance.retriever is None:
-                if not self.retriever_instance.initialize_sync():
-                    return {
-                        "answer": "I'm sorry, the system is still initializing. Please check your environment variables and try again.",
-                        "sources": []
-                    }
-            
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.retriever_instance.retriever,
-                chain_type_kwargs={"prompt": self.simple_prompt},
-                return_source_documents=True
-            )
-            
-            result = qa_chain.invoke({"query": question})
-            
-            sources = []
-            for doc in result.get("source_documents", []):
-                source = doc.metadata.get("source", "Unknown")
-                if source not in sources:
-                    sources.append(source)
-            
-            return {
-                "answer": result["result"],
-                "sources": sources
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting simple answer: {e}")
-            return {
-                "answer": "I'm sorry, I encountered an error while processing your question.",
-                "sources": []
-            }
+    def _generate(self, mode: str, prompt: PromptTemplate, question: str, documents: list, deadline: float, started: float, routing_question: str = None):
+        budget = (deadline if deadline is not None else self.deadline_seconds) - (time.monotonic() - started)
+        # Conversation history makes the prompt longer, not the question harder
+        tier = self.router.route(mode, routing_question or question, documents)
+        with get_tracer().span("completion", mode=mode, tier=tier.name, model=tier.model, budget_ms=round(budget * 1000)) as span:
+            try:
+                # Completions are read-only, so they can be retried and hedged
+                result = self.llm_callers[mode].call(
+                    self.router.generate,
+                    tier,
+                    lambda llm: load_qa_chain(llm, chain_type="stuff", prompt=prompt),
+                    {"input_documents": documents, "question": question},
+                    budget,
+                    deadline=budget
+                )
+                span.set(outcome="ok", answer_chars=len(result["output_text"]))
+                return {"result": result["output_text"], "source_documents": documents}
+            except (TimeoutError, CircuitOpenError, SaturatedError) as e:
+                span.set(outcome=type(e).__name__)
+                logger.warning(f"LLM unavailable for {mode} mode ({e}), degrading to extractive answer")
+                return None
     
-    def get_technical_answer(self, question: str) -> Dict[str, Any]:
-        try:
-            # Check if retriever is initialized
-            if not self.retriever_instance.initialized or self.retriever_instance.retriever is None:
-                if not self.retriever_instance.initialize_sync():
-                    return {
-                        "answer": "I'm sorry, the system is still initializing. Please check your environment variables and try again.",
-                        "sources": []
-                    }
-            
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.retriever_instance.retriever,
-                chain_type_kwargs={"prompt": self.technical_prompt},
-                return_source_documents=True
-            )
-            
-            result = qa_chain.invoke({"query": question})
-            
-            sources = []
-            for doc in result.get("source_documents", []):
-                source = doc.metadata.get("source", "Unknown")
-                if source not in sources:
-                    sources.append(source)
-            
-            return {
-                "answer": result["result"],
-                "sources": sources
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting technical answer: {e}")
-            return {
-                "answer": "I'm sorry, I encountered an error while processing your question.",
-                "sources": []
-            }
+    def get_routing_stats(self) -> Dict[str, Any]:
+        return self.router.get_stats()
     
-    def get_definition(self, term: str) -> Dict[str, Any]:
-        try:
-            # Check if retriever is initialized
-            if not self.retriever_instance.initialized or self.retriever_instance.retriever is None:
-                if not self.retriever_instance.initialize_sync():
-                    return {
-                        "answer": "I'm sorry, the system is still initializing. Please check your environment variables and try again.",
-                        "sources": []
-                    }
-            
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.retriever_instance.retriever,
-                chain_type_kwargs={"prompt": self.glossary_prompt},
-                return_source_documents=True
-            )
-            
-            result = qa_chain.invoke({"query": term})
-            
-            sources = []
-            for doc in result.get("source_documents", []):
-                source = doc.metadata.get("source", "Unknown")
-                if source not in sources:
-                    sources.append(source)
-            
-            return {
-                "answer": result["result"],
-                "sources": sources
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting definition: {e}")
-            return {
-                "answer": "I'm sorry, I encountered an error while processing your request.",
-                "sources": []
-            }
+    def get_retrieval_stats(self) -> Dict[str, Any]:
+        return self.retriever_instance.get_retrieval_stats()
+    
+    def get_provider_stats(self) -> Dict[str, Any]:
+        return self.provider_clients.get_stats()
+    
+    def get_resilience_stats(self) -> Dict[str, Any]:
+        return {
+            **{caller.name: caller.get_stats() for caller in self.llm_callers.values()},
+            **self.retriever_instance.embeddings.get_resilience_stats()
+        }
+    
+    def _extract_sources(self, result: Dict[str, Any]) -> List[str]:
+        sources = []
+        for doc in result.get("source_documents", []):
+            source = doc.metadata.get("source", "Unknown")
+            if source not in sources:
+                sources.append(source)
+        return sources
     
-    def compare_terms(self, term1: str, term2: str) -> Dict[str, Any]:
+    def compare_terms(self, term1: str, term2: str, deadline: float = None) -> Dict[str, Any]:
         try:
             # Create a comparison prompt that only uses context and query
             comparison_prompt = PromptTemplate(
@@ -282,43 +292,75 @@ class HealthcareQAChain:
             # Check if retriever is initialized
             if not self.retriever_instance.initialized or self.retriever_instance.retriever is None:
                 if not self.retriever_instance.initialize_sync():
-                    return {
-                        "comparison": "I'm sorry, the system is still initializing. Please check your environment variables and try again.",
-                        "sources": []
-                    }
+                    return self._get_fallback_comparison(term1, term2)
             
             # Create a combined query for retrieval
             query = f"Compare {term1} vs {term2} - differences similarities healthcare"
             
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.retriever_instance.retriever,
-                chain_type_kwargs={"prompt": comparison_prompt},
-                return_source_documents=True
-            )
+            started = time.monotonic()
+            with get_tracer().span("retrieval") as span:
+                results = self.retriever_instance.retrieve_adaptive(query, "compare")
+                documents = [doc for doc, _ in results]
+                span.set(documents=len(documents))
             
-            result = qa_chain.invoke({"query": query})
-            
-            sources = []
-            for doc in result.get("source_documents", []):
-                source = doc.metadata.get("source", "Unknown")
-                if source not in sources:
-                    sources.append(source)
+            result = self._generate("compare", comparison_prompt, query, documents, deadline, started)
+            if result is None:
+                return self._get_fallback_comparison(term1, term2)
             
             return {
                 "comparison": result["result"],
-                "sources": sources
+                "sources": self._extract_sources(result),
+                "extractive": False
             }
             
         except Exception as e:
             logger.error(f"Error comparing terms: {e}")
+            return self._get_fallback_comparison(term1, term2)
+    
+    def get_extractive_answer(self, question: str) -> Optional[Dict[str, Any]]:
+        # Re-index lazily whenever the active corpus changes; the chunks are only copied out when it has.
+        # Only the very first build is waited for, later callers answer from the previous index meanwhile
+        if self.retriever_instance.corpus_version() != self.extractive.corpus_version:
+            if self._extractive_lock.acquire(blocking=self.extractive.corpus_version is None):
+                try:
+                    if self.retriever_instance.corpus_version() != self.extractive.corpus_version:
+                        version, documents = self.retriever_instance.get_corpus()
+                        if documents:
+                            self.extractive.index(version, documents)
+                finally:
+                    self._extractive_lock.release()
+        
+        return self.extractive.answer(question)
+    
+    def _get_fallback_comparison(self, term1: str, term2: str) -> Dict[str, Any]:
+        first = self.get_extractive_answer(term1)
+        second = self.get_extractive_answer(term2)
+        if first is None and second is None:
             return {
-                "comparison": "I'm sorry, I encountered an error while comparing these terms.",
-                "sources": []
+                "comparison": "I'm sorry, I couldn't compare these terms right now. Please try again shortly.",
+                "sources": [],
+                "extractive": True
             }
+        
+        sections = []
+        sources = []
+        for term, result in ((term1, first), (term2, second)):
+            sections.append(f"{term}:\n{result['answer'] if result else 'No matching passages found.'}")
+            for source in (result["sources"] if result else []):
+                if source not in sources:
+                    sources.append(source)
+        
+        return {"comparison": "\n\n".join(sections), "sources": sources, "extractive": True}
     
     def _get_fallback_answer(self, question: str) -> Dict[str, Any]:
+        # Best matching passages from the ingested corpus, ranked locally
+        try:
+            extractive = self.get_extractive_answer(question)
+            if extractive is not None:
+                return {**extractive, "extractive": True}
+        except Exception as e:
+            logger.error(f"Error getting extractive answer: {e}")
+        
         basic_healthcare_info = {
             "hcpcs": "HCPCS (Healthcare Common Procedure Coding System) is a standardized coding system for medical procedures and supplies.",
             "cpt": "CPT (Current Procedural Terminology) codes describe medical, surgical, and diagnostic services.",
@@ -334,10 +376,12 @@ class HealthcareQAChain:
             if term in question_lower:
                 return {
                     "answer": f"{definition}\n\nNote: System is initializing. For more detailed information, please check your environment setup and try again.",
-                    "sources": ["Basic Healthcare Glossary"]
+                    "sources": ["Basic Healthcare Glossary"],
+                    "extractive": True
                 }
         
         return {
             "answer": "I'm sorry, the system is still initializing. Please check your environment variables (OPENAI_API_KEY) and try again. For immediate help with basic terms like HCPCS, CPT, ICD-10, DME, EDI, HIPAA, or CMS, please ask specifically about those terms.",
-            "sources": []
+            "sources": [],
+            "extractive": True
         }
@@ -1,4 +1,7 @@
 import os
+import re
+import hashlib
+from datetime import date
 from typing import List, Dict
 from pathlib import Path
 import logging
@@ -7,8 +10,44 @@ from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
+from dedupe import NearDuplicateDetector, content_hash, chunk_key
+
 logger = logging.getLogger(__name__)
 
+# Keyword tables used to tag chunks with structured metadata; first entry wins ties
+CATEGORY_KEYWORDS = {
+    "coding": ["hcpcs", "cpt", "icd-10", "code set", "modifier"],
+    "billing": ["claim", "837", "835", "remittance", "edi", "reimbursement"],
+    "compliance": ["hipaa", "privacy", "security", "regulation", "compliance"],
+    "equipment": ["dme", "durable medical equipment", "wheelchair", "oxygen"],
+    "coverage": ["prior authorization", "deductible", "copay", "coverage", "benefit"],
+}
+
+PAYER_KEYWORDS = {
+    "medicare": ["medicare"],
+    "medicaid": ["medicaid"],
+    "commercial": ["commercial", "private insurance", "health plan"],
+}
+
+CODE_SYSTEM_KEYWORDS = {
+    "hcpcs": ["hcpcs"],
+    "cpt": ["cpt"],
+    "icd-10": ["icd-10", "icd10"],
+    "x12": ["x12", "837", "835", "270/271"],
+    "ndc": ["ndc", "national drug code"],
+}
+
+# Metadata fields that can be used to filter retrieval
+FILTER_FIELDS = ("category", "payer", "code_system", "document_year", "source")
+
+def _best_match(text: str, table: Dict[str, List[str]], default: str) -> str:
+    best, best_count = default, 0
+    for label, keywords in table.items():
+        count = sum(len(re.findall(rf"\b{re.escape(keyword)}\b", text)) for keyword in keywords)
+        if count > best_count:
+            best, best_count = label, count
+    return best
+
 class DocumentProcessor:
     def __init__(self, data_dir: str = "../data"):
         self.data_dir = Path(data_dir)
@@ -22,6 +61,14 @@ class DocumentProcessor:
         )
         
         self.processed_documents = []
+        
+        # Near-duplicate chunks are dropped before embedding
+        self.deduplicator = NearDuplicateDetector(threshold=float(os.getenv("DEDUPE_THRESHOLD", "0.85")))
+        self.source_hashes = {}
+        self.dedupe_reports = []
+        self.last_report = None
+        # Chunks the last processed document adds to the index, and ids of indexed chunks it replaces
+        self.last_changes = None
     
     def load_pdf(self, file_path: str) -> List[Document]:
         try:
@@ -43,7 +90,29 @@ class DocumentProcessor:
             logger.error(f"Error loading text file {file_path}: {e}")
             return []
     
-    def process_document(self, file_path: str) -> bool:
+    def tag_metadata(self, doc: Document, overrides: Dict = None):
+        text = doc.page_content.lower()
+        metadata = doc.metadata
+        if overrides:
+            metadata.update({key: value for key, value in overrides.items() if value})
+        
+        metadata.setdefault("category", _best_match(text, CATEGORY_KEYWORDS, "general"))
+        metadata.setdefault("payer", _best_match(text, PAYER_KEYWORDS, "all"))
+        metadata.setdefault("code_system", _best_match(text, CODE_SYSTEM_KEYWORDS, "none"))
+        
+        if "document_date" not in metadata:
+            source = Path(metadata.get("source", ""))
+            # Prefer a year in the file name (e.g. yearly manual revisions), then the file date
+            year_match = re.search(r"(19|20)\d{2}", source.name)
+            if year_match:
+                metadata["document_date"] = f"{year_match.group(0)}-01-01"
+            elif source.is_file():
+                metadata["document_date"] = date.fromtimestamp(source.stat().st_mtime).isoformat()
+            else:
+                metadata["document_date"] = date.today().isoformat()
+        metadata.setdefault("document_year", metadata["document_date"][:4])
+    
+    def process_document(self, file_path: str, metadata: Dict = None) -> bool:
         try:
             file_path = Path(file_path)
             
@@ -63,27 +132,85 @@ class DocumentProcessor:
             if not documents:
                 return False
             
+            source = str(file_path)
+            file_hash = hashlib.sha1(file_path.read_bytes()).hexdigest()
+            
+            # Re-processing an unchanged file (e.g. the sample glossary) adds nothing
+            if self.source_hashes.get(source) == file_hash:
+                self._record_report({"source": source, "unchanged": True, "chunks": 0, "unique": 0,
+                                     "exact_duplicates": 0, "near_duplicates": 0, "dedupe_ratio": 0.0})
+                logger.info(f"Skipped unchanged document {file_path}")
+                return True
+            
             # Add metadata
             for doc in documents:
                 doc.metadata.update({
-                    'source': str(file_path),
+                    'source': source,
                     'document_type': 'healthcare',
-                    'processed': True
+                    'processed': True,
+                    'file_hash': file_hash
                 })
             
             # Split documents into chunks
             chunks = self.text_splitter.split_documents(documents)
             
+            # Tag each chunk so retrieval can filter by partition
+            for i, chunk in enumerate(chunks):
+                self.tag_metadata(chunk, metadata)
+                chunk.metadata["chunk_id"] = content_hash(f"{source}:{i}:{chunk.page_content}")[:16]
+            
+            # A changed file replaces its earlier chunks, so they no longer count as canonical copies.
+            # Copies from other documents that were linked to them are checked again after the new chunks
+            orphans = self.deduplicator.remove_source(source)
+            self.processed_documents = [d for d in self.processed_documents if d.metadata.get('source') != source]
+            
+            chunks, replaced, report = self.deduplicator.filter(chunks)
+            readmitted, replaced_by_readmitted, _ = self.deduplicator.filter(orphans)
+            replaced |= replaced_by_readmitted
+            self.source_hashes[source] = file_hash
+            self._record_report({"source": source, "unchanged": False, **report, "readmitted": len(readmitted)})
+            
             # Store processed chunks
-            self.processed_documents.extend(chunks)
+            self.processed_documents = [d for d in self.processed_documents if chunk_key(d) not in replaced]
+            self.processed_documents.extend(chunks + readmitted)
+            self.last_changes = {"documents": chunks + readmitted, "replaced_chunks": replaced}
             
-            logger.info(f"Successfully processed {file_path}: {len(chunks)} chunks created")
+            logger.info(
+                f"Successfully processed {file_path}: {report['unique']} chunks kept "
+                f"({report['replaced_older']} replacing older copies), {report['exact_duplicates']} exact and "
+                f"{report['near_duplicates']} near duplicates dropped, {len(readmitted)} copies from other documents readmitted"
+            )
             return True
             
         except Exception as e:
             logger.error(f"Error processing document {file_path}: {e}")
             return False
     
+    def _record_report(self, report: Dict):
+        self.last_report = report
+        self.dedupe_reports.append(report)
+        del self.dedupe_reports[:-100]
+    
+    def seed_indexed_chunks(self, documents: List[Document], duplicates: List[Document] = ()):
+        # Registers chunks that are already indexed, and the copies linked to them, so new uploads are checked against them
+        for doc in documents:
+            self.deduplicator.add(doc)
+            if doc.metadata.get('file_hash'):
+                self.source_hashes[doc.metadata.get('source', 'Unknown')] = doc.metadata['file_hash']
+        
+        for doc in duplicates:
+            if doc.metadata.get('duplicate_of') in self.deduplicator.documents:
+                self.deduplicator.link(doc.metadata['duplicate_of'], [doc])
+                if doc.metadata.get('file_hash'):
+                    self.source_hashes.setdefault(doc.metadata.get('source', 'Unknown'), doc.metadata['file_hash'])
+        logger.info(f"Seeded near-duplicate index with {len(documents)} indexed chunks and {len(duplicates)} linked copies")
+    
+    def reset_indexed_chunks(self, documents: List[Document], duplicates: List[Document] = ()):
+        # Forgets what ingest registered and starts over from the chunks that are actually indexed or queued
+        self.deduplicator = NearDuplicateDetector(threshold=self.deduplicator.threshold)
+        self.source_hashes = {}
+        self.seed_indexed_chunks(documents, duplicates)
+    
     def process_directory(self, directory_path: str = None) -> int:
         if directory_path is None:
             directory_path = self.data_dir
@@ -0,0 +1,177 @@
+import re
+import hashlib
+import logging
+from typing import List, Dict, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+def chunk_key(doc: Document) -> str:
+    # Chunks indexed before ingest assigned ids get a stable one derived from their source and text
+    return doc.metadata.get("chunk_id") or content_hash(f"{doc.metadata.get('source', 'Unknown')}:{doc.page_content}")[:16]
+
+class NearDuplicateDetector:
+    def __init__(self, num_perm: int = 128, bands: int = 16, threshold: float = 0.85, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+        # Universal hash family (a * x + b) mod p; a < 2^31 keeps a * x inside uint64
+        generator = np.random.RandomState(seed)
+        self.perm_a = generator.randint(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.perm_b = generator.randint(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+        self.signatures = {}
+        self.documents = {}
+        self.exact_index = {}
+        self.buckets = [{} for _ in range(bands)]
+        # canonical chunk id -> dropped copies, kept so they can come back if the canonical chunk goes away
+        self.links = {}
+
+    def _shingles(self, text: str) -> set:
+        words = normalize_text(text).split(" ")
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in self._shingles(text)),
+            dtype=np.uint64
+        )
+        permuted = (np.outer(hashes, self.perm_a) + self.perm_b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def find_duplicate(self, text: str, signature: np.ndarray = None) -> Tuple[str, float]:
+        exact = self.exact_index.get(content_hash(text))
+        if exact is not None:
+            return exact, 1.0
+
+        if signature is None:
+            signature = self.signature(text)
+
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        best_id, best_similarity = None, 0.0
+        for candidate in candidates:
+            similarity = float(np.mean(self.signatures[candidate] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_id, best_similarity = candidate, similarity
+        return best_id, best_similarity
+
+    def add(self, doc: Document, signature: np.ndarray = None):
+        if signature is None:
+            signature = self.signature(doc.page_content)
+
+        chunk_id = chunk_key(doc)
+        self.signatures[chunk_id] = signature
+        self.documents[chunk_id] = doc
+        self.exact_index.setdefault(content_hash(doc.page_content), chunk_id)
+        for band, key in enumerate(self._band_keys(signature)):
+            self.buckets[band].setdefault(key, []).append(chunk_id)
+
+    def link(self, canonical: str, copies: List[Document]):
+        for doc in copies:
+            doc.metadata["duplicate_of"] = canonical
+        self.links.setdefault(canonical, []).extend(copies)
+
+    def linked_documents(self, canonical_ids: set) -> List[Document]:
+        return [doc for chunk_id in canonical_ids for doc in self.links.get(chunk_id, ())]
+
+    def _remove(self, removed: set):
+        for chunk_id in removed:
+            del self.signatures[chunk_id]
+            del self.documents[chunk_id]
+        self.exact_index = {h: chunk_id for h, chunk_id in self.exact_index.items() if chunk_id not in removed}
+        for buckets in self.buckets:
+            for key in list(buckets):
+                buckets[key] = [chunk_id for chunk_id in buckets[key] if chunk_id not in removed]
+                if not buckets[key]:
+                    del buckets[key]
+
+    def remove_source(self, source: str) -> List[Document]:
+        # Returns the copies other documents lose their canonical chunk to, so the caller can admit them again
+        removed = {chunk_id for chunk_id, doc in self.documents.items() if doc.metadata.get("source") == source}
+        orphans = [
+            doc for chunk_id in removed for doc in self.links.pop(chunk_id, ())
+            if doc.metadata.get("source") != source
+        ]
+
+        # Copies the old version of this source contributed are replaced along with it
+        for chunk_id in list(self.links):
+            self.links[chunk_id] = [doc for doc in self.links[chunk_id] if doc.metadata.get("source") != source]
+            if not self.links[chunk_id]:
+                del self.links[chunk_id]
+
+        self._remove(removed)
+        for doc in orphans:
+            doc.metadata.pop("duplicate_of", None)
+        return orphans
+
+    def filter(self, chunks: List[Document]) -> Tuple[List[Document], set, Dict]:
+        # Returns the chunks to index, the ids of indexed chunks they replace, and a report
+        admitted = {}
+        replaced = set()
+        exact_count = 0
+        near_count = 0
+        newer_count = 0
+
+        for chunk in chunks:
+            signature = self.signature(chunk.page_content)
+            canonical, similarity = self.find_duplicate(chunk.page_content, signature)
+
+            if canonical is None:
+                self.add(chunk, signature)
+                admitted[chunk_key(chunk)] = chunk
+                continue
+
+            # The newest revision's wording (e.g. this year's codes and amounts) becomes the canonical copy
+            current = self.documents[canonical]
+            if chunk.metadata.get("document_date", "") > current.metadata.get("document_date", ""):
+                copies = self.links.pop(canonical, []) + [current]
+                self._remove({canonical})
+                self.add(chunk, signature)
+                self.link(chunk_key(chunk), copies)
+                if admitted.pop(canonical, None) is None:
+                    replaced.add(canonical)
+                admitted[chunk_key(chunk)] = chunk
+                newer_count += 1
+                continue
+
+            # Drop the copy before it is embedded, but keep it in case its canonical chunk goes away
+            self.link(canonical, [chunk])
+            if similarity == 1.0:
+                exact_count += 1
+            else:
+                near_count += 1
+
+        report = {
+            "chunks": len(chunks),
+            "unique": len(admitted),
+            "exact_duplicates": exact_count,
+            "near_duplicates": near_count,
+            "replaced_older": newer_count,
+            "dedupe_ratio": round((exact_count + near_count) / len(chunks), 4) if chunks else 0.0
+        }
+        return list(admitted.values()), replaced, report
@@ -1,18 +1,53 @@
 import os
-from typing import List
+from typing import List, Dict, Optional
 import logging
 
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 
+from index_store import IndexStore, SnapshotRetriever
+from resilience import ResilientCaller, ResilientEmbeddings
+from provider_client import get_provider_clients
+from batching import EmbeddingBatcher
+from tracing import get_tracer
+
 logger = logging.getLogger(__name__)
 
+def chroma_filter(filters: Optional[Dict[str, str]]) -> Optional[dict]:
+    # Chroma needs an explicit $and clause when filtering on several fields
+    if not filters:
+        return None
+    clauses = [{field: value} for field, value in filters.items()]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
 class HealthcareEmbeddings:    
     def __init__(self, model_name: str = "text-embedding-ada-002"):
-        self.embeddings = OpenAIEmbeddings(model=model_name)
+        # Retries, hedging and circuit breaking live in the resilience layer, not the client
+        query_timeout = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "5"))
+        batch_timeout = float(os.getenv("EMBEDDING_BATCH_TIMEOUT_SECONDS", "120"))
+        # Every retriever's clients share the process-wide connection pool; each client times out with its caller
+        client = lambda timeout: OpenAIEmbeddings(
+            model=model_name, max_retries=0, request_timeout=timeout, **get_provider_clients().client_kwargs()
+        )
+        self.embeddings = ResilientEmbeddings(
+            client(batch_timeout),
+            query_caller=ResilientCaller("embed_query", timeout=query_timeout),
+            documents_caller=ResilientCaller("embed_documents", timeout=batch_timeout, hedge=False),
+            query_embeddings=client(query_timeout)
+        )
+        # Query embeddings from concurrent requests share one provider call
+        self.embeddings.query_batcher = EmbeddingBatcher(
+            self.embeddings.embed_query_batch,
+            window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")),
+            max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+        )
         self.vector_store = None
         self.vector_store_path = "../data/chroma_db"
+        
+        # Memory-mapped index generation that serves every search; Chroma is only read to migrate an old store
+        self.index_store = None
+        self.snapshot = None
     
     def create_vector_store(self, documents: List[Document]) -> bool:
         try:
@@ -53,57 +88,139 @@ class HealthcareEmbeddings:
             logger.error(f"Error loading vector store: {e}")
             return False
     
-    def add_documents(self, documents: List[Document]) -> bool:
+    def embed_documents(self, documents: List[Document]) -> List[List[float]]:
+        if not documents:
+            return []
+        return self.embeddings.embed_documents([doc.page_content for doc in documents])
+    
+    def load_snapshot(self, index_store: IndexStore) -> bool:
         try:
-            if self.vector_store is None:
-                logger.error("Vector store not initialized")
+            snapshot = index_store.open_current()
+            if snapshot is None:
+                logger.warning("No published index generation found")
                 return False
             
-            # Add documents to vector store
-            self.vector_store.add_documents(documents)
-            
-            # Chroma automatically persists
-            logger.info(f"Added {len(documents)} documents to vector store")
+            self.index_store = index_store
+            self.snapshot = snapshot
+            logger.info(f"Index snapshot {snapshot.generation} loaded with {len(snapshot)} chunks")
             return True
             
         except Exception as e:
-            logger.error(f"Error adding documents to vector store: {e}")
+            logger.error(f"Error loading index snapshot: {e}")
             return False
     
-    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
+    def refresh_snapshot(self) -> bool:
+        # Only readers follow CURRENT; the writer swaps in the generations it builds itself
+        if self.index_store is None:
+            return False
+        
+        generation = self.index_store.current_generation()
+        if generation is None or (self.snapshot is not None and generation == self.snapshot.generation):
+            return False
+        
+        # In-flight searches keep their reference to the old snapshot until they finish
+        return self.load_snapshot(self.index_store)
+    
+    def export_vectors(self) -> tuple:
         try:
             if self.vector_store is None:
                 logger.error("Vector store not initialized")
-                return []
+                return [], []
             
-            results = self.vector_store.similarity_search(query, k=k)
-            logger.info(f"Found {len(results)} similar documents for query: {query}")
-            return results
+            data = self.vector_store.get(include=["embeddings", "documents", "metadatas"])
+            documents = [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(data["documents"], data["metadatas"])
+            ]
+            return documents, list(data["embeddings"])
             
         except Exception as e:
-            logger.error(f"Error performing similarity search: {e}")
-            return []
+            logger.error(f"Error exporting vectors: {e}")
+            return [], []
     
-    def similarity_search_with_score(self, query: str, k: int = 5) -> List[tuple]:
+    def add_documents(self, documents: List[Document]) -> bool:
         try:
             if self.vector_store is None:
                 logger.error("Vector store not initialized")
-                return []
+                return False
             
-            results = self.vector_store.similarity_search_with_score(query, k=k)
-            logger.info(f"Found {len(results)} similar documents with scores for query: {query}")
-            return results
+            # Add documents to vector store
+            self.vector_store.add_documents(documents)
+            
+            # Chroma automatically persists
+            logger.info(f"Added {len(documents)} documents to vector store")
+            return True
             
         except Exception as e:
-            logger.error(f"Error performing similarity search with scores: {e}")
+            logger.error(f"Error adding documents to vector store: {e}")
+            return False
+    
+    def similarity_search(self, query: str, k: int = 5, filters: Dict[str, str] = None) -> List[Document]:
+        if self.snapshot is not None:
+            return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filters=filters)]
+        
+        if self.vector_store is None:
+            logger.error("Vector store not initialized")
             return []
+        
+        # Chroma embeds the query itself, so the span covers both steps
+        with get_tracer().span("vector_search", backend="chroma", k=k, filters=sorted(filters or {})) as span:
+            results = self.vector_store.similarity_search(query, k=k, filter=chroma_filter(filters))
+            span.set(results=len(results))
+        logger.debug(f"Found {len(results)} similar documents in Chroma")
+        return results
     
-    def get_retriever(self, search_kwargs: dict = None):
+    def similarity_search_with_score(self, query: str, k: int = 5, filters: Dict[str, str] = None) -> List[tuple]:
+        # Search errors propagate, so the chains fall back instead of answering from an empty context
+        snapshot = self.active_snapshot()
+        if snapshot is not None:
+            return self._search_snapshot(snapshot, query, k, filters)
+        
         if self.vector_store is None:
             logger.error("Vector store not initialized")
-            return None
+            return []
         
+        with get_tracer().span("vector_search", backend="chroma", k=k, filters=sorted(filters or {})) as span:
+            results = self.vector_store.similarity_search_with_score(query, k=k, filter=chroma_filter(filters))
+            span.set(results=len(results))
+        logger.debug(f"Found {len(results)} similar documents with scores in Chroma")
+        return results
+    
+    def active_snapshot(self):
+        if self.snapshot is not None:
+            self.refresh_snapshot()
+        return self.snapshot
+    
+    def embed_query(self, query: str) -> List[float]:
+        with get_tracer().span("embedding", query_chars=len(query)):
+            return self.embeddings.embed_query(query)
+    
+    def _search_snapshot(self, snapshot, query: str, k: int, filters: Dict[str, str] = None) -> List[tuple]:
+        query_vector = self.embed_query(query)
+        
+        with get_tracer().span("vector_search", backend="snapshot", generation=snapshot.generation, precision=snapshot.precision,
+                         k=k, filters=sorted(filters or {})) as span:
+            results = snapshot.search(query_vector, k=k, filters=filters)
+            span.set(results=len(results), scores=[round(score, 4) for _, score in results])
+        logger.debug(f"Found {len(results)} similar documents in snapshot {snapshot.generation}")
+        return results
+    
+    def get_resilience_stats(self) -> dict:
+        return {
+            "embed_query": self.embeddings.query_caller.get_stats(),
+            "embed_documents": self.embeddings.documents_caller.get_stats(),
+            "embed_query_batches": self.embeddings.query_batcher.get_stats()
+        }
+    
+    def get_retriever(self, search_kwargs: dict = None):
         if search_kwargs is None:
             search_kwargs = {"k": 5}
         
+        if self.snapshot is not None:
+            return SnapshotRetriever(embeddings=self, search_kwargs=search_kwargs)
+        
+        if self.vector_store is None:
+            logger.error("Vector store not initialized")
+            return None
+        
         return self.vector_store.as_retriever(search_kwargs=search_kwargs)
@@ -0,0 +1,146 @@
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+# Glossary-style headers such as "HCPCS (Healthcare Common Procedure Coding System):"
+TERM_HEADER_PATTERN = re.compile(r"^([A-Z][^:.\n]{0,120}):\s*$")
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "me", "of", "on", "or", "the", "to", "what", "when", "which", "who", "why", "with"
+}
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def split_passages(doc: Document) -> List[Dict[str, Any]]:
+    # Glossary entries become one passage per term; other text is split into sentences
+    source = doc.metadata.get("source", "Unknown")
+    units = []
+    term = None
+    term_lines = []
+
+    def flush_term():
+        if term and term_lines:
+            units.append({"text": f"{term}: {' '.join(term_lines)}", "term": term, "source": source})
+
+    for line in doc.page_content.splitlines():
+        line = line.strip()
+        header = TERM_HEADER_PATTERN.match(line)
+        if header:
+            flush_term()
+            term, term_lines = header.group(1), []
+        elif not line:
+            flush_term()
+            term, term_lines = None, []
+        elif term:
+            term_lines.append(line)
+        else:
+            for sentence in SENTENCE_SPLIT_PATTERN.split(line):
+                if len(sentence) > 20:
+                    units.append({"text": sentence, "term": None, "source": source})
+    flush_term()
+    return units
+
+def extract_definitions(documents: List[Document]) -> Dict[str, Dict[str, Any]]:
+    # term -> its definition passage; overlapping chunks yield the same entry more than once
+    definitions = {}
+    for doc in documents:
+        for unit in split_passages(doc):
+            if unit["term"]:
+                current = definitions.get(unit["term"])
+                if current is None or len(unit["text"]) > len(current["text"]):
+                    definitions[unit["term"]] = unit
+    return definitions
+
+class ExtractiveAnswerer:
+    def __init__(self, k1: float = 1.5, b: float = 0.75, definition_boost: float = 2.0):
+        self.k1 = k1
+        self.b = b
+        self.definition_boost = definition_boost
+        self.corpus_version = None
+        self.units = []
+        # token -> [(passage id, frequency)], so a question only touches passages sharing a token with it
+        self.postings = {}
+        self.average_length = 0.0
+        self._lock = threading.Lock()
+
+    def index(self, corpus_version: str, documents: List[Document]):
+        units = []
+        for doc in documents:
+            units.extend(split_passages(doc))
+
+        postings = {}
+        for unit_id, unit in enumerate(units):
+            tokens = Counter(tokenize(unit["text"]))
+            unit["length"] = sum(tokens.values())
+            unit["term_tokens"] = set(tokenize(unit["term"])) if unit["term"] else set()
+            for token, frequency in tokens.items():
+                postings.setdefault(token, []).append((unit_id, frequency))
+
+        with self._lock:
+            self.units = units
+            self.postings = postings
+            self.average_length = sum(u["length"] for u in units) / len(units) if units else 0.0
+            self.corpus_version = corpus_version
+
+        logger.info(f"Extractive index built with {len(units)} passages for corpus {corpus_version}")
+
+    def _score(self, units: List[Dict[str, Any]], postings: Dict[str, list], average_length: float,
+               query_tokens: List[str]) -> Dict[int, float]:
+        # Okapi BM25 over passages, with a boost when the question names a glossary term
+        total = len(units)
+        scores = {}
+        for token in query_tokens:
+            matches = postings.get(token, ())
+            idf = math.log(1 + (total - len(matches) + 0.5) / (len(matches) + 0.5))
+            for unit_id, frequency in matches:
+                norm = self.k1 * (1 - self.b + self.b * units[unit_id]["length"] / (average_length or 1.0))
+                scores[unit_id] = scores.get(unit_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        query_set = set(query_tokens)
+        for unit_id in scores:
+            if units[unit_id]["term_tokens"] & query_set:
+                scores[unit_id] *= self.definition_boost
+        return scores
+
+    def answer(self, question: str, max_passages: int = 3) -> Optional[Dict[str, Any]]:
+        query_tokens = tokenize(question)
+        if not query_tokens:
+            return None
+
+        # index() swaps in new objects rather than mutating these, so scoring can run outside the lock
+        with self._lock:
+            units, postings, average_length = self.units, self.postings, self.average_length
+
+        scores = self._score(units, postings, average_length, query_tokens)
+        # Ties keep corpus order
+        ranked = [
+            (score, units[unit_id])
+            for unit_id, score in sorted(scores.items(), key=lambda item: (-item[1], item[0])) if score > 0
+        ]
+        if not ranked:
+            return None
+
+        passages = []
+        sources = []
+        for score, unit in ranked:
+            # Overlapping chunks repeat passages
+            if unit["text"] in passages:
+                continue
+            passages.append(unit["text"])
+            if unit["source"] not in sources:
+                sources.append(unit["source"])
+            if len(passages) == max_passages:
+                break
+
+        return {"answer": "\n\n".join(passages), "sources": sources}
@@ -0,0 +1,134 @@
+import json
+import time
+import base64
+import random
+import struct
+import hashlib
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSIONS = 1536
+
+class FakeProviderConfig:
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 0.0, slow_rate: float = 0.0,
+                 slow_ms: float = 5000.0, error_rate: float = 0.0, answer: str = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # A fraction of calls land in a slow tail to exercise hedging and deadlines
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.answer = answer
+
+    def delay(self) -> float:
+        if random.random() < self.slow_rate:
+            return self.slow_ms / 1000
+        return (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+
+def fake_embedding(text: str) -> list:
+    # Deterministic unit vector seeded by the text, so identical inputs embed identically
+    generator = random.Random(hashlib.sha1(text.encode("utf-8")).digest())
+    vector = [generator.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    # Keep-alive like the real API, so connection reuse can be measured against it
+    protocol_version = "HTTP/1.1"
+    config = FakeProviderConfig()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        time.sleep(self.config.delay())
+        if random.random() < self.config.error_rate:
+            self._send(500, {"error": {"message": "Injected provider error", "type": "server_error"}})
+            return
+
+        if self.path.endswith("/embeddings"):
+            self._send(200, self._embeddings(request))
+        elif self.path.endswith("/chat/completions"):
+            self._send(200, self._chat_completion(request))
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def _embeddings(self, request: dict) -> dict:
+        inputs = request.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+
+        data = []
+        for i, item in enumerate(inputs):
+            vector = fake_embedding(item if isinstance(item, str) else json.dumps(item))
+            if request.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+
+        tokens = sum(len(str(item).split()) for item in inputs)
+        return {"object": "list", "data": data, "model": request.get("model", "fake-embedding"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def _chat_completion(self, request: dict) -> dict:
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        answer = self.config.answer or f"Fake answer from {request.get('model', 'fake-model')}."
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(answer.split())
+        return {
+            "id": f"chatcmpl-fake-{random.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake-model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+def start_fake_provider(config: FakeProviderConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    # Point the app at it with OPENAI_BASE_URL=http://host:port/v1
+    handler = type("ConfiguredFakeProviderHandler", (FakeProviderHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Fake provider listening on http://{host}:{server.server_address[1]}/v1")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible fake provider with injected latency and errors")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=5000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeProviderConfig(args.latency_ms, args.jitter_ms, args.slow_rate, args.slow_ms, args.error_rate)
+    server = start_fake_provider(config, args.host, args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import os
+import json
+import mmap
+import fcntl
+import shutil
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple, Any
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from data_ingestion import FILTER_FIELDS
+from quantization import CompactVectors, write_compact_vectors
+
+logger = logging.getLogger(__name__)
+
+# Precomputed row-id sets per value of each filterable metadata field
+def build_partitions(metadatas: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[int]]]:
+    partitions = {field: {} for field in FILTER_FIELDS}
+    for i, metadata in enumerate(metadatas):
+        for field in FILTER_FIELDS:
+            value = metadata.get(field)
+            if value is not None:
+                partitions[field].setdefault(str(value), []).append(i)
+    return partitions
+
+class IndexSnapshot:
+    def __init__(self, path: Path, precision: str = None, rescore_factor: int = None):
+        self.path = Path(path)
+        self.generation = self.path.name
+
+        # Memory-map everything read-only so all workers share the same page cache
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        
+        # Optional float16/int8 copy, also mmap'd; candidates are re-scored against the float32 rows
+        self.precision = precision or os.getenv("VECTOR_PRECISION", "float32")
+        self.rescore_factor = rescore_factor or int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+        self.compact = CompactVectors.load(self.path, self.precision, self.vectors)
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        with open(self.path / "documents.jsonl", "rb") as f:
+            self.documents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        partitions_file = self.path / "partitions.json"
+        if partitions_file.exists():
+            with open(partitions_file, "r", encoding="utf-8") as f:
+                partitions = json.load(f)
+        else:
+            partitions = build_partitions([self.get_document(i).metadata for i in range(len(self))])
+        self.partitions = {
+            field: {value: np.asarray(ids, dtype=np.int64) for value, ids in values.items()}
+            for field, values in partitions.items()
+        }
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def get_document(self, index: int) -> Document:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        record = json.loads(self.documents[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def get_duplicates(self) -> List[Document]:
+        # Copies dropped at ingest, linked to their canonical chunk by metadata["duplicate_of"]; only the writer reads these
+        duplicates_file = self.path / "duplicates.jsonl"
+        if not duplicates_file.exists():
+            return []
+        with open(duplicates_file, "r", encoding="utf-8") as f:
+            return [Document(page_content=record["page_content"], metadata=record["metadata"]) for record in map(json.loads, f)]
+
+    def partition_ids(self, filters: Dict[str, str]) -> Optional[np.ndarray]:
+        ids = None
+        for field, value in filters.items():
+            if field not in self.partitions:
+                raise ValueError(f"Cannot filter on unpartitioned field: {field}")
+            field_ids = self.partitions[field].get(str(value), np.empty(0, dtype=np.int64))
+            ids = field_ids if ids is None else np.intersect1d(ids, field_ids, assume_unique=True)
+        return ids
+
+    def search(self, query_vector: List[float], k: int = 5, filters: Dict[str, str] = None) -> List[Tuple[Document, float]]:
+        return [(self.get_document(row), distance) for row, distance in self.search_rows(query_vector, k, filters)]
+
+    def search_rows(self, query_vector: List[float], k: int = 5, filters: Dict[str, str] = None, exclude: set = None) -> List[Tuple[int, float]]:
+        if len(self) == 0:
+            return []
+
+        query = self._unit(query_vector)
+
+        # Filtered searches only read and score the rows in the matching partition
+        ids = self.partition_ids(filters) if filters else None
+        if ids is not None and len(ids) == 0:
+            return []
+
+        # Excluded rows (chunks the caller already holds) are over-fetched and dropped afterwards
+        fetch = k + len(exclude or ())
+        if self.compact is None:
+            similarities = self.vectors @ query if ids is None else self.vectors[ids] @ query
+            top = self._top(similarities, fetch)
+            rows = top if ids is None else ids[top]
+            similarities = similarities[top]
+        else:
+            # Shortlist on the compact codes, then rank the shortlist exactly
+            approximate = self.compact.score(query, ids)
+            candidates = self._top(approximate, fetch * self.rescore_factor)
+            candidates = np.sort(candidates if ids is None else ids[candidates])
+            exact = self.vectors[candidates] @ query
+            top = self._top(exact, fetch)
+            rows = candidates[top]
+            similarities = exact[top]
+
+        # Squared L2 distance between unit vectors, same scale as Chroma's default scores
+        results = [(int(row), float(2.0 - 2.0 * similarity)) for row, similarity in zip(rows, similarities)]
+        if exclude:
+            results = [(row, distance) for row, distance in results if row not in exclude]
+        return results[:k]
+
+    def distances(self, query_vector: List[float], rows: List[int]) -> List[float]:
+        # Exact scores for rows the caller already holds, without searching the index
+        if not rows:
+            return []
+        order = np.argsort(rows)
+        scores = np.empty(len(rows), dtype=np.float32)
+        scores[order] = self.vectors[np.asarray(rows)[order]] @ self._unit(query_vector)
+        return [float(2.0 - 2.0 * score) for score in scores]
+
+    @staticmethod
+    def _unit(query_vector: List[float]) -> np.ndarray:
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+
+class IndexStore:
+    def __init__(self, root: str = None):
+        self.root = Path(root or os.getenv("INDEX_DIR", "../data/index"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.inbox_dir = self.root / "inbox"
+        self.inbox_dir.mkdir(exist_ok=True)
+        self.current_file = self.root / "CURRENT"
+        self.previous_file = self.root / "PREVIOUS"
+
+    def list_generations(self) -> List[str]:
+        # A generation only counts once its manifest has been written
+        return sorted(p.parent.name for p in self.root.glob("gen-*/manifest.json"))
+
+    def current_generation(self) -> Optional[str]:
+        return self._read_pointer(self.current_file)
+
+    def previous_generation(self) -> Optional[str]:
+        return self._read_pointer(self.previous_file)
+
+    def generation_path(self, generation: str) -> Path:
+        return self.root / generation
+
+    def open_current(self) -> Optional[IndexSnapshot]:
+        generation = self.current_generation()
+        if generation is None:
+            return None
+
+        try:
+            return IndexSnapshot(self.root / generation)
+        except Exception as e:
+            logger.error(f"Error opening index generation {generation}: {e}")
+            return None
+
+    def read_manifest(self, generation: str) -> Dict[str, Any]:
+        with open(self.root / generation / "manifest.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def create_generation(self) -> Tuple[str, Path]:
+        existing = sorted(p.name for p in self.root.glob("gen-*") if p.is_dir())
+        number = int(existing[-1].split("-")[1]) + 1 if existing else 1
+        generation = f"gen-{number:06d}"
+        path = self.root / generation
+        path.mkdir()
+        return generation, path
+
+    def write_snapshot(self, path: Path, documents: List[Document], vectors: List[List[float]], duplicates: List[Document] = ()):
+        if not documents or len(documents) != len(vectors):
+            raise ValueError("Cannot write an empty or mismatched index snapshot")
+
+        # Store unit vectors so readers can score with a single dot product
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+        np.save(path / "vectors.npy", matrix)
+        write_compact_vectors(path, matrix)
+
+        offsets = [0]
+        with open(path / "documents.jsonl", "wb") as f:
+            for doc in documents:
+                line = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}).encode("utf-8") + b"\n"
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+            f.flush()
+            os.fsync(f.fileno())
+        np.save(path / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+        with open(path / "duplicates.jsonl", "w", encoding="utf-8") as f:
+            for doc in duplicates:
+                f.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}) + "\n")
+
+        with open(path / "partitions.json", "w", encoding="utf-8") as f:
+            json.dump(build_partitions([doc.metadata for doc in documents]), f)
+
+    def finalize(self, path: Path, manifest: Dict[str, Any]):
+        self._write_atomic(path / "manifest.json", json.dumps(manifest, indent=2))
+
+    def activate(self, generation: str):
+        current = self.current_generation()
+        if current is not None and current != generation:
+            self._write_atomic(self.previous_file, current)
+        self._write_atomic(self.current_file, generation)
+        logger.info(f"Activated index generation {generation}")
+
+    def rollback(self) -> Optional[str]:
+        previous = self.previous_generation()
+        if previous is None or previous not in self.list_generations():
+            logger.error("No previous index generation to roll back to")
+            return None
+
+        self.activate(previous)
+        return previous
+
+    def garbage_collect(self, keep: int = 2) -> List[str]:
+        generations = self.list_generations()
+        protected = set(generations[-keep:]) | {self.current_generation(), self.previous_generation()}
+        newest = generations[-1] if generations else ""
+        removed = []
+
+        for path in sorted(self.root.glob("gen-*")):
+            # Incomplete generations newer than the last finished one may still be building
+            if path.name in protected or path.name > newest:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path.name)
+
+        if removed:
+            logger.info(f"Garbage-collected index generations: {', '.join(removed)}")
+        return removed
+
+    def _read_pointer(self, pointer_file: Path) -> Optional[str]:
+        try:
+            generation = pointer_file.read_text(encoding="utf-8").strip()
+            return generation or None
+        except FileNotFoundError:
+            return None
+
+    def _write_atomic(self, target: Path, content: str):
+        tmp_file = target.with_name(target.name + ".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, target)
+
+    @contextmanager
+    def lock(self, name: str, blocking: bool = True):
+        # Advisory lock shared by every process using the same index directory
+        with open(self.root / f".{name}.lock", "w") as f:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(f.fileno(), flags)
+                acquired = True
+            except BlockingIOError:
+                acquired = False
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class SnapshotRetriever(BaseRetriever):
+    embeddings: Any
+    search_kwargs: dict = {"k": 5}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.embeddings.similarity_search(query, k=self.search_kwargs.get("k", 5))
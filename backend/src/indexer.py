@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from retriever import HealthcareRetriever
+from index_store import IndexStore
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SUFFIXES = ('.pdf', '.txt', '.md')
+
+def process_inbox(retriever: HealthcareRetriever) -> int:
+    inbox_dir = retriever.index_store.inbox_dir
+    failed_dir = inbox_dir / "failed"
+    processed_count = 0
+
+    for file_path in sorted(inbox_dir.iterdir()):
+        if not file_path.is_file() or file_path.suffix.lower() not in SUPPORTED_SUFFIXES:
+            continue
+
+        # Tags supplied at upload time travel in a sidecar file
+        metadata = None
+        metadata_file = file_path.with_name(file_path.name + ".meta.json")
+        if metadata_file.exists():
+            with open(metadata_file, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+            metadata_file.unlink()
+
+        # Move out of the inbox first so the document path stays stable in chunk metadata
+        target = retriever.document_processor.data_dir / file_path.name
+        shutil.move(str(file_path), target)
+
+        if retriever.add_document(str(target), metadata):
+            processed_count += 1
+        else:
+            failed_dir.mkdir(exist_ok=True)
+            shutil.move(str(target), failed_dir / file_path.name)
+            logger.error(f"Failed to index {file_path.name}, moved to {failed_dir}")
+
+    return processed_count
+
+def rollback():
+    # Flips CURRENT back to the previous generation; readers follow on their next query
+    index_store = IndexStore()
+    with index_store.lock("build"):
+        generation = index_store.rollback()
+
+    if generation is None:
+        sys.exit(1)
+    logger.info(f"Rolled back to index generation {generation}")
+
+def main():
+    if sys.argv[1:] == ["rollback"]:
+        rollback()
+        return
+
+    poll_interval = float(os.getenv("INDEXER_POLL_INTERVAL", "2.0"))
+    retriever = HealthcareRetriever(role="writer")
+
+    # Exactly one writer may own ingestion for an index directory
+    with retriever.index_store.lock("writer", blocking=False) as acquired:
+        if not acquired:
+            logger.error("Another index writer is already running")
+            sys.exit(1)
+
+        if not retriever.initialized and not retriever.initialize_sync():
+            logger.error("Failed to initialize the index writer")
+            sys.exit(1)
+
+        logger.info(f"Index writer watching {retriever.index_store.inbox_dir}")
+        while True:
+            retriever.follow_current()
+            processed_count = process_inbox(retriever)
+            if processed_count:
+                logger.info(f"Indexed {processed_count} queued documents")
+            time.sleep(poll_interval)
+
+if __name__ == "__main__":
+    main()
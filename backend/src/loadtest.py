@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import shutil
+import tempfile
+import itertools
+import socket
+import asyncio
+import argparse
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIX = {"ask": 85, "compare": 10, "documents": 5, "upload": 0}
+
+DEFAULT_QUESTIONS = [
+    ("What is HCPCS?", "glossary"),
+    ("What does DME stand for?", "glossary"),
+    ("Define prior authorization", "glossary"),
+    ("What is a CPT code?", "simple"),
+    ("How does a claim get processed?", "simple"),
+    ("What is the difference between Level I and Level II HCPCS codes?", "standard"),
+    ("What is an EDI 837 transaction?", "standard"),
+    ("Who administers Medicare and Medicaid?", "standard"),
+    ("Explain the HIPAA requirements for exchanging electronic claims and remittance advice", "technical"),
+    ("How do ICD-10 diagnosis codes relate to medical necessity review and claim denials?", "technical"),
+]
+
+DEFAULT_COMPARISONS = [("HCPCS", "CPT"), ("Medicare", "Medicaid"), ("ICD-10", "CPT"), ("DME", "prosthetics")]
+
+def default_requests(mix: Dict[str, int], count: int, seed: int) -> List[Dict[str, Any]]:
+    generator = random.Random(seed)
+    endpoints = [endpoint for endpoint, weight in mix.items() if weight > 0]
+    weights = [mix[endpoint] for endpoint in endpoints]
+    requests = []
+    for i in range(count):
+        endpoint = generator.choices(endpoints, weights)[0]
+        if endpoint == "ask":
+            question, mode = generator.choice(DEFAULT_QUESTIONS)
+            requests.append({"endpoint": "ask", "json": {"question": question, "mode": mode}})
+        elif endpoint == "compare":
+            term1, term2 = generator.choice(DEFAULT_COMPARISONS)
+            requests.append({"endpoint": "compare", "json": {"term1": term1, "term2": term2}})
+        elif endpoint == "upload":
+            requests.append({"endpoint": "upload", "filename": f"loadtest-{seed}-{i}.txt",
+                             "text": f"Load test document {i}.\n\nTerm {i}:\nA synthetic definition used for load testing."})
+        else:
+            requests.append({"endpoint": "documents"})
+    return requests
+
+def load_log(path: str) -> List[Dict[str, Any]]:
+    # One request per line, in the format --record writes; bare {"question", "mode"} lines are /ask calls
+    requests = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "endpoint" not in record:
+                record = {"endpoint": "ask", "json": {"question": record["question"], "mode": record.get("mode", "standard")}}
+            requests.append(record)
+    return requests
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1) if samples else 0.0
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+        self.by_endpoint = {}
+
+    def record(self, endpoint: str, status: int, seconds: float):
+        self.latencies.append(seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.by_endpoint.setdefault(endpoint, []).append(seconds)
+        if status == 0 or status >= 400:
+            self.errors += 1
+
+    def summary(self, level: str, elapsed: float) -> Dict[str, Any]:
+        latencies = len(self.latencies)
+        return {
+            "level": level,
+            "requests": latencies,
+            "throughput_rps": round(latencies / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": percentile_ms(self.latencies, 0.5),
+            "p95_ms": percentile_ms(self.latencies, 0.95),
+            "p99_ms": percentile_ms(self.latencies, 0.99),
+            "error_rate": round(self.errors / latencies, 4) if latencies else 0.0,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "endpoints": {
+                endpoint: {"requests": len(samples), "p50_ms": percentile_ms(samples, 0.5), "p95_ms": percentile_ms(samples, 0.95)}
+                for endpoint, samples in self.by_endpoint.items()
+            }
+        }
+
+async def send(client: httpx.AsyncClient, request: Dict[str, Any], results: Results, started: float, headers: Dict[str, str] = None):
+    endpoint = request["endpoint"]
+    try:
+        if endpoint == "ask":
+            response = await client.post("/ask", json=request["json"], headers=headers)
+        elif endpoint == "compare":
+            response = await client.post("/compare", json=request["json"], headers=headers)
+        elif endpoint == "upload":
+            files = {"file": (request["filename"], request["text"].encode("utf-8"), "text/plain")}
+            response = await client.post("/upload", files=files)
+        else:
+            response = await client.get("/documents")
+        status = response.status_code
+    except httpx.HTTPError as e:
+        logger.warning(f"{endpoint} request failed: {e}")
+        status = 0
+    # Measured from the intended start, so open-loop queueing delay counts against latency
+    results.record(endpoint, status, time.monotonic() - started)
+
+async def closed_loop(client: httpx.AsyncClient, requests: List[Dict[str, Any]], concurrency: int, duration: float) -> Results:
+    # Each virtual user sends its next request as soon as the previous one returns
+    results = Results()
+    deadline = time.monotonic() + duration
+    position = itertools.count()
+
+    async def user(number: int):
+        # Admission control keys on the address, so the id only spreads slots evenly between virtual users
+        headers = {"X-Client-Id": f"loadtest-{number}"}
+        while time.monotonic() < deadline:
+            request = requests[next(position) % len(requests)]
+            await send(client, request, results, time.monotonic(), headers)
+
+    await asyncio.gather(*(user(number) for number in range(concurrency)))
+    return results
+
+async def open_loop(client: httpx.AsyncClient, requests: List[Dict[str, Any]], rate: float, duration: float, seed: int) -> Results:
+    # Poisson arrivals at a fixed rate, independent of how quickly the server answers
+    results = Results()
+    generator = random.Random(seed)
+    tasks = []
+    started = time.monotonic()
+    scheduled = started
+    i = 0
+    while scheduled < started + duration:
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(client, requests[i % len(requests)], results, scheduled)))
+        i += 1
+        scheduled += generator.expovariate(rate)
+    await asyncio.gather(*tasks)
+    return results
+
+async def run_levels(base_url: str, requests: List[Dict[str, Any]], args) -> List[Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    summaries = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        levels = args.rates if args.mode == "open" else args.concurrency
+        for level in levels:
+            started = time.monotonic()
+            if args.mode == "open":
+                results = await open_loop(client, requests, level, args.duration, args.seed)
+                label = f"{level:g} rps"
+            else:
+                results = await closed_loop(client, requests, int(level), args.duration)
+                label = f"{int(level)} users"
+            summary = results.summary(label, time.monotonic() - started)
+            summaries.append(summary)
+            print_summary(summary)
+    return summaries
+
+def print_summary(summary: Dict[str, Any]):
+    print(
+        f"{summary['level']:>12}  {summary['requests']:>7} req  {summary['throughput_rps']:>8} rps  "
+        f"p50 {summary['p50_ms']:>8} ms  p95 {summary['p95_ms']:>8} ms  p99 {summary['p99_ms']:>8} ms  "
+        f"errors {summary['error_rate']:.2%}  {summary['statuses']}",
+        flush=True
+    )
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_in_process(llm_latency_ms: float, llm_jitter_ms: float) -> str:
+    # The stub provider answers both embeddings and completions, so no API key or network is needed
+    from fake_provider import FakeProviderConfig, start_fake_provider
+    provider = start_fake_provider(FakeProviderConfig(latency_ms=llm_latency_ms, jitter_ms=llm_jitter_ms))
+    os.environ["PROVIDER_BASE_URL"] = f"http://127.0.0.1:{provider.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "loadtest")
+    # Every virtual user connects from 127.0.0.1, which admission control counts as a single client
+    os.environ.setdefault("ADMISSION_MAX_QUEUED_PER_CLIENT", "100000")
+
+    # Generations, uploads, answers and traces go to a scratch directory, never the developer's data/.
+    # The remaining ../data paths are relative to the working directory, so run from scratch/src
+    scratch = Path(tempfile.mkdtemp(prefix="loadtest-"))
+    atexit.register(shutil.rmtree, scratch, ignore_errors=True)
+    os.environ["INDEX_DIR"] = str(scratch / "data" / "index")
+    os.environ["ANSWER_STORE_PATH"] = str(scratch / "data" / "answers.db")
+    os.environ["TRACE_FILE"] = str(scratch / "data" / "traces" / "traces.jsonl")
+    (scratch / "src").mkdir()
+    (scratch / "data").mkdir()
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    os.chdir(scratch / "src")
+
+    import uvicorn
+    from main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {endpoint: 0 for endpoint in DEFAULT_MIX}
+    for part in value.split(","):
+        endpoint, weight = part.split("=")
+        if endpoint not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {endpoint}")
+        mix[endpoint] = int(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive /ask, /compare, /upload and /documents and report throughput and latency per load level")
+    parser.add_argument("--url", help="base URL of a running instance (default: start one in-process with a stub LLM)")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4, 16, 64],
+                        help="closed loop: concurrent users per level")
+    parser.add_argument("--rates", type=lambda v: [float(x) for x in v.split(",")], default=[5, 10, 20, 40],
+                        help="open loop: arrivals per second per level")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per level")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="endpoint weights, e.g. ask=80,compare=10,documents=8,upload=2")
+    parser.add_argument("--replay", help="JSONL request log to replay instead of the generated mix")
+    parser.add_argument("--record", help="write the generated request mix to this JSONL file for later replay")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="in-process stub LLM latency")
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the per-level summaries to this file")
+    args = parser.parse_args()
+
+    requests = load_log(args.replay) if args.replay else default_requests(args.mix, 1000, args.seed)
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request) + "\n")
+
+    base_url = args.url or start_in_process(args.llm_latency_ms, args.llm_jitter_ms)
+    print(f"Load testing {base_url} ({args.mode} loop, {len(requests)} request mix, {args.duration:g}s per level)")
+    summaries = asyncio.run(run_levels(base_url, requests, args))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+
+if __name__ == "__main__":
+    main()
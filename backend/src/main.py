@@ -1,8 +1,13 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Dict
 import os
+import json
+import time
+import shutil
+from contextlib import asynccontextmanager
 import logging
 from dotenv import load_dotenv
 
@@ -12,9 +17,12 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-from data_ingestion import DocumentProcessor
 from retriever import HealthcareRetriever
 from chains import HealthcareQAChain
+from answer_store import AnswerStore
+from sessions import SessionStore
+from tracing import get_tracer
+from admission import AdmissionController, AdmissionRejected
 
 # Load environment variables
 load_dotenv()
@@ -37,27 +45,40 @@ app.add_middleware(
 )
 
 # Initialize components
-document_processor = DocumentProcessor()
 retriever = HealthcareRetriever()
-qa_chain = HealthcareQAChain()
+document_processor = retriever.document_processor
+qa_chain = HealthcareQAChain(retriever=retriever, answer_store=AnswerStore())
+sessions = SessionStore()
+admission = AdmissionController()
 
 # Pydantic models for request/response
 class QuestionRequest(BaseModel):
     question: str
     mode: Optional[str] = "standard"
+    # e.g. {"payer": "medicare", "category": "coding"}
+    filters: Optional[Dict[str, str]] = None
+    # Latency budget for the LLM; past it an extractive answer is returned
+    deadline_ms: Optional[int] = None
+    # Client-generated conversation id; follow-ups reuse the session's turns and chunks
+    session_id: Optional[str] = None
 
 class QuestionResponse(BaseModel):
     answer: str
     sources: List[str]
     mode: str
+    extractive: bool = False
+    precomputed: bool = False
+    session_id: Optional[str] = None
 
 class ComparisonRequest(BaseModel):
     term1: str
     term2: str
+    deadline_ms: Optional[int] = None
 
 class ComparisonResponse(BaseModel):
     comparison: str
     sources: List[str]
+    extractive: bool = False
 
 @app.get("/")
 async def root():
@@ -68,48 +89,113 @@ async def health_check():
     return {"status": "healthy"}
 
 @app.post("/ask", response_model=QuestionResponse)
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, http_request: Request):
     try:
-        # Process the question based on mode
-        if request.mode == "glossary":
-            result = qa_chain.get_definition(request.question)
-        elif request.mode == "simple":
-            result = qa_chain.get_simple_answer(request.question)
-        elif request.mode == "technical":
-            result = qa_chain.get_technical_answer(request.question)
-        else:
-            result = qa_chain.get_answer(request.question)
+        filters = retriever.validate_filters(request.filters)
+        session = sessions.get(request.session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    deadline = request.deadline_ms / 1000 if request.deadline_ms else None
+    
+    # Process the question based on mode
+    if request.mode == "glossary":
+        answer = qa_chain.get_definition
+    elif request.mode == "simple":
+        answer = qa_chain.get_simple_answer
+    elif request.mode == "technical":
+        answer = qa_chain.get_technical_answer
+    else:
+        answer = qa_chain.get_answer
+    
+    try:
+        # One trace per request; the question text itself is never recorded
+        with get_tracer().trace("ask", mode=request.mode, question_chars=len(request.question),
+                                filters=sorted(filters), session=session is not None) as span:
+            async with admit(request.mode, http_request) as waited:
+                # Time spent queued comes out of the caller's latency budget
+                span.set(admission_wait_ms=round(waited * 1000, 1))
+                remaining = max(0.0, deadline - waited) if deadline is not None else None
+                result = await run_in_threadpool(answer, request.question, filters, remaining, session)
+            span.set(extractive=result.get("extractive", False), precomputed=result.get("precomputed", False))
         
         return QuestionResponse(
             answer=result["answer"],
             sources=result["sources"],
-            mode=request.mode
+            mode=request.mode,
+            extractive=result.get("extractive", False),
+            precomputed=result.get("precomputed", False),
+            session_id=request.session_id
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/compare", response_model=ComparisonResponse)
-async def compare_terms(request: ComparisonRequest):
+async def compare_terms(request: ComparisonRequest, http_request: Request):
     try:
-        result = qa_chain.compare_terms(request.term1, request.term2)
+        deadline = request.deadline_ms / 1000 if request.deadline_ms else None
+        with get_tracer().trace("compare") as span:
+            async with admit("compare", http_request) as waited:
+                span.set(admission_wait_ms=round(waited * 1000, 1))
+                remaining = max(0.0, deadline - waited) if deadline is not None else None
+                result = await run_in_threadpool(qa_chain.compare_terms, request.term1, request.term2, remaining)
+            span.set(extractive=result.get("extractive", False))
         return ComparisonResponse(
             comparison=result["comparison"],
-            sources=result["sources"]
+            sources=result["sources"],
+            extractive=result.get("extractive", False)
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@asynccontextmanager
+async def admit(mode: str, http_request: Request):
+    # Limits and fairness are keyed on the connection address (run uvicorn with --proxy-headers behind a trusted proxy).
+    # X-Client-Id is caller-supplied, so it only orders requests from the same address
+    client = http_request.client.host if http_request.client else "unknown"
+    started = time.monotonic()
+    try:
+        async with admission.admit(mode, client, http_request.headers.get("X-Client-Id")):
+            yield time.monotonic() - started
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
 @app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(
+    file: UploadFile = File(...),
+    category: Optional[str] = Form(None),
+    payer: Optional[str] = Form(None),
+    code_system: Optional[str] = Form(None)
+):
     try:
+        # Explicit tags override the ones inferred from the text
+        metadata = {
+            key: value.lower()
+            for key, value in {"category": category, "payer": payer, "code_system": code_system}.items()
+            if value
+        }
+        
         # Save uploaded file
         file_path = f"../data/uploaded_{file.filename}"
         with open(file_path, "wb") as f:
             content = await file.read()
             f.write(content)
         
-        # Process the document
-        success = document_processor.process_document(file_path)
+        # Query workers hand ingestion off to the single writer process
+        if retriever.role == "reader":
+            inbox_path = retriever.index_store.inbox_dir / os.path.basename(file_path)
+            if metadata:
+                with open(f"{inbox_path}.meta.json", "w", encoding="utf-8") as f:
+                    json.dump(metadata, f)
+            shutil.move(file_path, inbox_path)
+            return {"message": f"Document {file.filename} queued for indexing"}
+        
+        # Process the document into the next index generation
+        success = retriever.add_document(file_path, metadata)
         
         if success:
             return {"message": f"Document {file.filename} processed successfully"}
@@ -122,14 +208,75 @@ async def upload_document(file: UploadFile = File(...)):
 @app.get("/documents")
 async def list_documents():
     try:
-        documents = document_processor.list_documents()
+        documents = retriever.list_documents()
         return {"documents": documents}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/routing")
+async def routing_stats():
+    return qa_chain.get_routing_stats()
+
+@app.get("/retrieval")
+async def retrieval_stats():
+    return qa_chain.get_retrieval_stats()
+
+@app.get("/resilience")
+async def resilience_stats():
+    return qa_chain.get_resilience_stats()
+
+@app.get("/provider")
+async def provider_stats():
+    return qa_chain.get_provider_stats()
+
+@app.delete("/sessions/{session_id}")
+async def end_session(session_id: str):
+    return {"ended": sessions.end(session_id)}
+
+@app.get("/sessions")
+async def session_stats():
+    return sessions.get_stats()
+
+@app.get("/admission")
+async def admission_stats():
+    return admission.get_stats()
+
+@app.get("/answers")
+async def answer_store_stats():
+    return qa_chain.answer_store.stats
+
+@app.get("/ingest/reports")
+async def ingest_reports():
+    return {"reports": retriever.get_ingest_reports()}
+
+@app.get("/index")
+async def index_status():
+    return {
+        "role": retriever.role,
+        "generation": retriever.index_store.current_generation(),
+        "previous_generation": retriever.index_store.previous_generation(),
+        "generations": retriever.index_store.list_generations(),
+        "rebuilding": retriever.is_rebuilding()
+    }
+
+@app.post("/index/rollback")
+async def rollback_index():
+    if retriever.role == "reader":
+        raise HTTPException(status_code=400, detail="Index rollback must run on the writer")
+    
+    if not retriever.rollback():
+        raise HTTPException(status_code=409, detail="No previous index generation to roll back to")
+    
+    return {"message": f"Rolled back to index generation {retriever.generation}"}
+
 @app.post("/initialize")
 async def initialize_system():
     try:
+        # Readers only pick up the latest published index generation
+        if retriever.role == "reader":
+            await retriever.initialize()
+            return {"message": "System initialized successfully"}
+        
         # Initialize with sample data
         await document_processor.initialize_sample_data()
         await retriever.initialize()
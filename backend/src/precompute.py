@@ -0,0 +1,100 @@
+import os
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from retriever import HealthcareRetriever
+from chains import HealthcareQAChain
+from extractive import extract_definitions
+from answer_store import AnswerStore, normalize_key, definition_hash
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+def generate_answer(qa_chain: HealthcareQAChain, term: str, mode: str, deadline: float) -> dict:
+    if mode == "glossary":
+        return qa_chain.get_definition(term, deadline=deadline)
+    if mode == "simple":
+        return qa_chain.get_simple_answer(f"What is {term}?", deadline=deadline)
+    return qa_chain.get_answer(f"What is {term}?", deadline=deadline)
+
+def refresh(retriever: HealthcareRetriever, qa_chain: HealthcareQAChain, store: AnswerStore, concurrency: int, deadline: float) -> dict:
+    version, documents = retriever.get_corpus()
+    definitions = extract_definitions(documents)
+    known_hashes = store.term_hashes()
+    report = {"corpus": version, "terms": len(definitions), "generated": 0, "failed": 0, "removed": 0}
+
+    # Terms whose definition text changed are regenerated; the rest only fill in missing modes
+    jobs = []
+    for term, unit in definitions.items():
+        term_id = normalize_key(term)
+        source_hash = definition_hash(unit["text"])
+        if known_hashes.get(term_id) != source_hash:
+            store.invalidate(term_id)
+            store.upsert_term(term, source_hash)
+        jobs.extend((term, mode) for mode in store.missing_modes(term_id))
+
+    current_ids = {normalize_key(term) for term in definitions}
+    for term_id in set(known_hashes) - current_ids:
+        store.delete_term(term_id)
+        report["removed"] += 1
+
+    # LLM calls fan out; sqlite writes stay on this thread
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(generate_answer, qa_chain, term, mode, deadline): (term, mode) for term, mode in jobs}
+        for future in as_completed(futures):
+            term, mode = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Error precomputing {mode} answer for {term}: {e}")
+                result = None
+
+            # Extractive fallbacks mean the LLM was unavailable; leave the slot for the next run
+            if result is None or result.get("extractive"):
+                report["failed"] += 1
+                continue
+
+            store.put_answer(term, mode, result["answer"], result["sources"])
+            report["generated"] += 1
+
+    logger.info(
+        f"Answer store refreshed for corpus {version}: {report['terms']} terms, {report['generated']} answers generated, "
+        f"{report['failed']} failed, {report['removed']} terms removed"
+    )
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute glossary, simple and standard answers for every corpus term")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("PRECOMPUTE_CONCURRENCY", "4")))
+    parser.add_argument("--deadline", type=float, default=float(os.getenv("PRECOMPUTE_DEADLINE_SECONDS", "60")))
+    parser.add_argument("--watch", action="store_true", help="keep running and refresh when the index generation changes")
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("PRECOMPUTE_POLL_INTERVAL", "30")))
+    args = parser.parse_args()
+
+    # Reads the published index like a query worker and never writes to it
+    retriever = HealthcareRetriever(role="reader")
+    if not retriever.initialized and not retriever.initialize_sync():
+        logger.error("Failed to load the index for precomputation")
+        return
+
+    qa_chain = HealthcareQAChain(retriever=retriever)
+    store = AnswerStore(read_only=False)
+    refresh(retriever, qa_chain, store, args.concurrency, args.deadline)
+
+    while args.watch:
+        time.sleep(args.poll_interval)
+        # A new generation means the corpus changed; only affected terms are regenerated
+        if retriever.embeddings.refresh_snapshot():
+            refresh(retriever, qa_chain, store, args.concurrency, args.deadline)
+
+if __name__ == "__main__":
+    main()
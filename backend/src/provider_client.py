@@ -0,0 +1,196 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+class ConnectionStats:
+    def __init__(self):
+        self.stats = {"requests": 0, "connections_opened": 0, "tls_handshakes": 0, "host_limit_waits": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def on_event(self, event_name: str):
+        # httpcore reports a connect/TLS event only when the pool has no idle connection to reuse
+        if event_name == "connection.connect_tcp.complete":
+            self.count("connections_opened")
+        elif event_name == "connection.start_tls.complete":
+            self.count("tls_handshakes")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        reused = max(0, stats["requests"] - stats["connections_opened"])
+        return {**stats, "reused": reused, "reuse_ratio": round(reused / stats["requests"], 4) if stats["requests"] else 0.0}
+
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self.stream = stream
+        self.release = release
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.release()
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.release()
+
+class HostLimitedTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.HTTPTransport, per_host: int, stats: ConnectionStats):
+        self.transport = transport
+        self.per_host = per_host
+        self.stats = stats
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._slots[host]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.count("requests")
+        request.extensions["trace"] = lambda event_name, info: self.stats.on_event(event_name)
+
+        slot = self._slot(request.url.host)
+        if not slot.acquire(blocking=False):
+            self.stats.count("host_limit_waits")
+            slot.acquire()
+
+        released = threading.Event()
+        def release():
+            if not released.is_set():
+                released.set()
+                slot.release()
+
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            release()
+            raise
+        # The slot is held until the body has been read and the response closed
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+class AsyncHostLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncHTTPTransport, per_host: int, stats: ConnectionStats):
+        self.transport = transport
+        self.per_host = per_host
+        self.stats = stats
+        self._slots = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.count("requests")
+
+        async def trace(event_name, info):
+            self.stats.on_event(event_name)
+        request.extensions["trace"] = trace
+
+        slot = self._slots.setdefault(request.url.host, asyncio.BoundedSemaphore(self.per_host))
+        if slot.locked():
+            self.stats.count("host_limit_waits")
+        await slot.acquire()
+
+        released = []
+        def release():
+            if not released:
+                released.append(True)
+                slot.release()
+
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _AsyncReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class ProviderClients:
+    def __init__(self):
+        # PROVIDER_BASE_URL points every component at one endpoint, e.g. fake_provider.py
+        self.base_url = os.getenv("PROVIDER_BASE_URL") or os.getenv("OPENAI_BASE_URL") or None
+        self.max_connections = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.getenv("PROVIDER_MAX_KEEPALIVE", "50"))
+        self.keepalive_expiry = float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY_SECONDS", "60"))
+        self.per_host = int(os.getenv("PROVIDER_MAX_CONNECTIONS_PER_HOST", str(self.max_connections)))
+        self.stats = ConnectionStats()
+        self.async_stats = ConnectionStats()
+
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        # Per-request timeouts are set by the callers; this only bounds connection setup
+        timeout = httpx.Timeout(None, connect=float(os.getenv("PROVIDER_CONNECT_TIMEOUT_SECONDS", "5")))
+
+        self.http_client = httpx.Client(
+            transport=HostLimitedTransport(httpx.HTTPTransport(limits=limits), self.per_host, self.stats),
+            timeout=timeout
+        )
+        self.http_async_client = httpx.AsyncClient(
+            transport=AsyncHostLimitedTransport(httpx.AsyncHTTPTransport(limits=limits), self.per_host, self.async_stats),
+            timeout=timeout
+        )
+
+        host = urlsplit(self.base_url).netloc if self.base_url else "api.openai.com"
+        logger.info(f"Provider clients pooled for {host} ({self.max_connections} connections, {self.per_host} per host)")
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        # Keyword arguments shared by ChatOpenAI and OpenAIEmbeddings
+        kwargs = {"http_client": self.http_client, "http_async_client": self.http_async_client}
+        if self.base_url:
+            kwargs["base_url"] = self.base_url
+        return kwargs
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url or "default",
+            "max_connections": self.max_connections,
+            "max_connections_per_host": self.per_host,
+            "sync": self.stats.get_stats(),
+            "async": self.async_stats.get_stats()
+        }
+
+_provider_clients: Optional[ProviderClients] = None
+_provider_clients_lock = threading.Lock()
+
+def get_provider_clients() -> ProviderClients:
+    # One pool per process, shared by every embeddings client and chat model
+    global _provider_clients
+    with _provider_clients_lock:
+        if _provider_clients is None:
+            _provider_clients = ProviderClients()
+        return _provider_clients
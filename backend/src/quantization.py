@@ -0,0 +1,60 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_PRECISIONS = ("float32", "float16", "int8")
+
+def quantize_int8(matrix: np.ndarray) -> tuple:
+    # Symmetric per-dimension scalar quantization; unit vectors keep every component in [-1, 1]
+    scale = np.abs(matrix).max(axis=0).astype(np.float32) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+def write_compact_vectors(path: Path, matrix: np.ndarray):
+    np.save(path / "vectors.f16.npy", matrix.astype(np.float16))
+    codes, scale = quantize_int8(matrix)
+    np.save(path / "vectors.i8.npy", codes)
+    np.save(path / "vectors.i8.scale.npy", scale)
+
+class CompactVectors:
+    def __init__(self, codes: np.ndarray, scale: np.ndarray = None):
+        self.codes = codes
+        self.scale = scale
+
+    @classmethod
+    def load(cls, path: Path, precision: str, vectors: np.ndarray) -> Optional["CompactVectors"]:
+        if precision == "float32":
+            return None
+        if precision not in VECTOR_PRECISIONS:
+            raise ValueError(f"Unsupported vector precision: {precision}")
+
+        # Memory-mapped like the float32 vectors, so every worker shares one copy in the page cache.
+        # Generations written before compact codes existed are quantized on load, into a private copy per worker
+        if precision == "float16":
+            codes_file = path / "vectors.f16.npy"
+            if codes_file.exists():
+                return cls(np.load(codes_file, mmap_mode="r"))
+            logger.warning(f"No float16 vectors in {path.name}, converting a private copy")
+            return cls(np.asarray(vectors, dtype=np.float16))
+
+        codes_file = path / "vectors.i8.npy"
+        if codes_file.exists():
+            return cls(np.load(codes_file, mmap_mode="r"), np.load(path / "vectors.i8.scale.npy"))
+        logger.warning(f"No int8 vectors in {path.name}, quantizing a private copy")
+        return cls(*quantize_int8(np.asarray(vectors)))
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0))
+
+    def score(self, query: np.ndarray, ids: np.ndarray = None) -> np.ndarray:
+        # Folding the scale into the query keeps the per-row work a plain dot product
+        query = query * self.scale if self.scale is not None else query
+        codes = self.codes if ids is None else self.codes[ids]
+        # einsum widens codes to float32 in small buffers instead of materializing a float32 copy
+        return np.einsum("ij,j->i", codes, query, dtype=np.float32)
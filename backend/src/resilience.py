@@ -0,0 +1,265 @@
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# When the attempt running on this thread expires, so provider clients can time out with it
+_attempt_expires_at = contextvars.ContextVar("attempt_expires_at", default=None)
+
+def remaining_budget() -> Optional[float]:
+    # Seconds left in the current attempt, or None outside a ResilientCaller
+    expires_at = _attempt_expires_at.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.monotonic())
+
+def _run_attempt(expires_at: float, run_started: list, fn: Callable, *args, **kwargs) -> Any:
+    # An attempt that waited in the executor past its budget is skipped; nobody is waiting for it any more
+    if time.monotonic() >= expires_at:
+        raise SaturatedError("Attempt expired while queued for the executor")
+    run_started.append(time.monotonic())
+    _attempt_expires_at.set(expires_at)
+    return fn(*args, **kwargs)
+
+class CircuitOpenError(Exception):
+    pass
+
+class SaturatedError(Exception):
+    # Local back-pressure; the call never reached the provider, so it says nothing about its health
+    pass
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10, cooldown: float = 30.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            # Half-open lets exactly one trial call through
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+                if success:
+                    self.state = "closed"
+                    self.outcomes.clear()
+                    logger.info(f"Circuit {self.name} closed")
+                else:
+                    self._open()
+                return
+
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+                self._open()
+
+    def release(self):
+        # An attempt that never reached the provider frees the half-open trial without an outcome
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        logger.warning(f"Circuit {self.name} opened, failing fast for {self.cooldown:.0f}s")
+
+class ResilientCaller:
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        executor: ThreadPoolExecutor = None,
+        hedge: bool = True,
+        hedge_percentile: float = 0.95,
+        min_hedge_delay: float = 0.05,
+        retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+        breaker: CircuitBreaker = None
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.executor = executor or ThreadPoolExecutor(max_workers=16)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(name)
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "retries": 0, "timeouts": 0, "errors": 0, "rejected": 0, "saturated": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def hedge_delay(self) -> float:
+        # Hedge only once there is enough history to know what "slow" means
+        if not self.hedge or len(self.latency) < 20:
+            return None
+        return max(self.min_hedge_delay, self.latency.percentile(self.hedge_percentile))
+
+    def call(self, fn: Callable, *args, deadline: float = None, idempotent: bool = True, **kwargs) -> Any:
+        self._count("calls")
+        budget = min(deadline, self.timeout) if deadline is not None else self.timeout
+        expires_at = time.monotonic() + budget
+        attempts = 1 + (self.retries if idempotent else 0)
+        last_error = None
+
+        for attempt in range(attempts):
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                break
+
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise CircuitOpenError(f"{self.name} circuit is open")
+
+            try:
+                result = self._attempt(fn, args, kwargs, remaining, idempotent)
+                self.breaker.record(True)
+                return result
+            except SaturatedError as e:
+                self._count("saturated")
+                self.breaker.release()
+                last_error = e
+                break
+            except TimeoutError as e:
+                # A timed-out attempt used up the budget; retrying would only overrun it
+                self._count("timeouts")
+                self.breaker.record(False)
+                last_error = e
+                break
+            except Exception as e:
+                self._count("errors")
+                self.breaker.record(False)
+                last_error = e
+
+            if attempt < attempts - 1:
+                # Full jitter exponential backoff, never past the deadline
+                backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                if time.monotonic() + backoff >= expires_at:
+                    break
+                self._count("retries")
+                time.sleep(backoff)
+
+        raise last_error or TimeoutError(f"{self.name} exceeded its {budget:.1f}s budget")
+
+    def _attempt(self, fn: Callable, args: tuple, kwargs: dict, remaining: float, idempotent: bool) -> Any:
+        started = time.monotonic()
+        expires_at = started + remaining
+        run_started = []
+        # Each attempt runs in a copy of the caller's context, so trace spans nest under the request
+        submit = lambda: self.executor.submit(
+            contextvars.copy_context().run, _run_attempt, expires_at, run_started, fn, *args, **kwargs
+        )
+        futures = [submit()]
+
+        hedge_delay = self.hedge_delay() if idempotent else None
+        if hedge_delay is not None and hedge_delay < remaining:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                self._count("hedged")
+                futures.append(submit())
+
+        pending = set(futures)
+        error = None
+        while pending:
+            timeout = remaining - (time.monotonic() - started)
+            if timeout <= 0:
+                break
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1 and future is futures[1]:
+                        self._count("hedge_wins")
+                    self.latency.record(time.monotonic() - started)
+                    return future.result()
+                error = future.exception()
+
+        if pending:
+            # Calls still queued are dropped; running ones finish within the budget their client was given
+            for future in pending:
+                future.cancel()
+            # Time spent waiting for a free thread is local back-pressure, not a slow provider
+            if not run_started or min(run_started) - started > time.monotonic() - min(run_started):
+                raise SaturatedError(f"{self.name} spent its {remaining:.1f}s budget waiting for the executor")
+            raise TimeoutError(f"{self.name} did not respond within {remaining:.1f}s")
+        raise error
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "p50": round(self.latency.percentile(0.5), 4),
+            "p95": round(self.latency.percentile(0.95), 4),
+            "circuit": self.breaker.state
+        }
+
+class ResilientEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, query_caller: ResilientCaller, documents_caller: ResilientCaller, query_batcher=None,
+                 query_embeddings: Embeddings = None):
+        self.embeddings = embeddings
+        # Query embeddings can use their own client, so its request timeout matches the query budget
+        self.query_embeddings = query_embeddings or embeddings
+        self.query_caller = query_caller
+        self.documents_caller = documents_caller
+        # Concurrent query embeddings are coalesced into one batched call when set
+        self.query_batcher = query_batcher
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_batcher is not None:
+            return self.query_batcher.embed(text)
+        return self.query_caller.call(self.query_embeddings.embed_query, text)
+
+    def embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.query_caller.call(self.query_embeddings.embed_documents, texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.documents_caller.call(self.embeddings.embed_documents, texts)
@@ -1,39 +1,116 @@
+import os
+import json
+import time
+import hashlib
 import logging
+import threading
 from typing import List, Dict, Any
 
+from langchain_core.documents import Document
+
 from embeddings import HealthcareEmbeddings
-from data_ingestion import DocumentProcessor
+from data_ingestion import DocumentProcessor, FILTER_FIELDS
+from dedupe import chunk_key
+from index_store import IndexStore, IndexSnapshot
+from tracing import get_tracer
 
 logger = logging.getLogger(__name__)
 
+WORKER_ROLES = ("standalone", "writer", "reader")
+
+# Chunks stuffed into the prompt per mode; RETRIEVAL_DEPTHS (JSON with the same shape) is merged in per mode
+DEFAULT_RETRIEVAL_DEPTHS = {
+    "glossary": {"min_k": 1, "max_k": 3},
+    "simple": {"min_k": 1, "max_k": 4},
+    "standard": {"min_k": 2, "max_k": 5},
+    "technical": {"min_k": 3, "max_k": 8},
+    "compare": {"min_k": 4, "max_k": 8},
+}
+
+def adaptive_depth(scores: List[float], min_k: int, max_k: int, max_distance: float, max_gap: float) -> tuple:
+    # Scores are distances (lower is closer); cut where they get too far or jump away from the previous hit
+    depth = min(len(scores), max_k)
+    for i in range(max(1, min_k), depth):
+        if scores[i] > max_distance:
+            return i, "threshold"
+        if scores[i] - scores[i - 1] > max_gap:
+            return i, "gap"
+    return depth, "max_k" if depth == max_k else "exhausted"
+
+# Upper bounds of the score histogram; distances run from 0 (same direction) to 4 (opposite)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0, 1.5, 2.0, 4.0)
+
+def score_bucket(score: float) -> float:
+    return next((bound for bound in SCORE_BUCKETS if score <= bound), SCORE_BUCKETS[-1])
+
 class HealthcareRetriever:    
-    def __init__(self):
+    def __init__(self, role: str = None):
+        # standalone: single process owns everything (default)
+        # writer: owns ingestion and publishes index generations
+        # reader: serves queries from the published read-only index
+        self.role = role or os.getenv("WORKER_ROLE", "standalone")
+        if self.role not in WORKER_ROLES:
+            raise ValueError(f"Unknown WORKER_ROLE: {self.role}")
+        
         self.embeddings = HealthcareEmbeddings()
-        self.document_processor = DocumentProcessor()
+        self.index_store = IndexStore()
+        self.document_processor = DocumentProcessor() if self.role != "reader" else None
         self.retriever = None
         self.initialized = False
+        self.generation = None
+        self.keep_generations = int(os.getenv("INDEX_KEEP_GENERATIONS", "2"))
+        
+        # Adaptive depth: fetch max_k, then keep only as many chunks as the scores justify
+        self.adaptive = os.getenv("RETRIEVAL_ADAPTIVE", "true").lower() == "true"
+        override = json.loads(os.getenv("RETRIEVAL_DEPTHS", "null")) or {}
+        self.depths = {
+            mode: {**DEFAULT_RETRIEVAL_DEPTHS.get(mode, {}), **override.get(mode, {})}
+            for mode in {**DEFAULT_RETRIEVAL_DEPTHS, **override}
+        }
+        # Unknown modes retrieve at the standard depth, so it has to exist
+        if "standard" not in self.depths:
+            raise ValueError("RETRIEVAL_DEPTHS must keep a 'standard' mode")
+        # Same scale as the search scores: squared L2 between unit vectors, i.e. 2 - 2 * cosine
+        self.max_distance = float(os.getenv("RETRIEVAL_MAX_DISTANCE", "0.5"))
+        self.max_gap = float(os.getenv("RETRIEVAL_SCORE_GAP", "0.06"))
+        self.depth_stats = {}
+        self._stats_lock = threading.Lock()
+        
+        # Background rebuild state; queries keep using the active generation meanwhile
+        self._swap_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_documents = []
+        self._pending_sources = set()
+        self._pending_chunks = set()
+        self._rebuild_thread = None
+        # Serializes ingest, since processing a document and queuing its chunks must not interleave with a resync
+        self._ingest_lock = threading.Lock()
+        self._seeded = False
         
         # Initialize with sample data immediately
         self.initialize_sync()
     
     def initialize_sync(self) -> bool:
         try:
-            # Try to load existing vector store
-            if self.embeddings.load_vector_store():
-                self.retriever = self.embeddings.get_retriever({"k": 5})
-                self.initialized = True
-                logger.info("Retriever initialized with existing vector store")
-                return True
+            if self.role == "reader":
+                return self._initialize_reader()
             
-            # If no vector store exists, create one with sample data
-            self.document_processor.initialize_sample_data_sync()
-            documents = self.document_processor.get_processed_documents()
-            
-            if documents:
-                if self.embeddings.create_vector_store(documents):
-                    self.retriever = self.embeddings.get_retriever({"k": 5})
-                    self.initialized = True
-                    logger.info("Retriever initialized with new vector store")
+            # Only one process may bootstrap the store; the rest wait and then load it
+            with self.index_store.lock("bootstrap"):
+                # Try to load the active generation
+                if self._load_current_generation():
+                    self._seed_document_processor()
+                    logger.info(f"Retriever initialized with index generation {self.generation}")
+                    return True
+                
+                # If no generation exists, build the first one from sample data
+                self.document_processor.initialize_sample_data_sync()
+                documents = self.document_processor.get_processed_documents()
+                
+                if documents and self.rebuild(documents, background=False):
+                    self._seeded = True
+                    logger.info(f"Retriever initialized with new index generation {self.generation}")
                     return True
             
             logger.error("Failed to initialize retriever")
@@ -45,22 +122,23 @@ class HealthcareRetriever:
     
     async def initialize(self) -> bool:
         try:
-            # Try to load existing vector store
-            if self.embeddings.load_vector_store():
-                self.retriever = self.embeddings.get_retriever({"k": 5})
-                self.initialized = True
-                logger.info("Retriever initialized with existing vector store")
-                return True
-            
-            # If no vector store exists, create one with sample data
-            await self.document_processor.initialize_sample_data()
-            documents = self.document_processor.get_processed_documents()
+            if self.role == "reader":
+                return self._initialize_reader()
             
-            if documents:
-                if self.embeddings.create_vector_store(documents):
-                    self.retriever = self.embeddings.get_retriever({"k": 5})
-                    self.initialized = True
-                    logger.info("Retriever initialized with new vector store")
+            with self.index_store.lock("bootstrap"):
+                # Try to load the active generation
+                if self._load_current_generation():
+                    self._seed_document_processor()
+                    logger.info(f"Retriever initialized with index generation {self.generation}")
+                    return True
+                
+                # If no generation exists, build the first one from sample data
+                await self.document_processor.initialize_sample_data()
+                documents = self.document_processor.get_processed_documents()
+                
+                if documents and self.rebuild(documents, background=False):
+                    self._seeded = True
+                    logger.info(f"Retriever initialized with new index generation {self.generation}")
                     return True
             
             logger.error("Failed to initialize retriever")
@@ -70,14 +148,425 @@ class HealthcareRetriever:
             logger.error(f"Error initializing retriever: {e}")
             return False
     
-    def retrieve_documents(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+    def _initialize_reader(self) -> bool:
+        # Readers never create or mutate the index; they wait for the writer to publish one
+        if self.embeddings.snapshot is not None:
+            self.embeddings.refresh_snapshot()
+            return True
+        
+        if not self.embeddings.load_snapshot(self.index_store):
+            logger.warning("Waiting for the writer to publish an index generation")
+            return False
+        
+        self.retriever = self.embeddings.get_retriever({"k": 5})
+        self.initialized = True
+        logger.info("Retriever initialized with read-only index snapshot")
+        return True
+    
+    def _load_current_generation(self) -> bool:
+        generation = self.index_store.current_generation()
+        if generation is None:
+            return False
+        
+        try:
+            snapshot = IndexSnapshot(self.index_store.generation_path(generation))
+        except Exception as e:
+            logger.error(f"Error opening index generation {generation}: {e}")
+            return False
+        
+        self._swap(snapshot)
+        return True
+    
+    def _seed_document_processor(self):
+        if self._seeded:
+            return
+        
+        snapshot = self.embeddings.snapshot
+        if snapshot is not None:
+            self.document_processor.seed_indexed_chunks(
+                [snapshot.get_document(i) for i in range(len(snapshot))], snapshot.get_duplicates()
+            )
+            # Carry the ingest history over a restart, since readers serve it from the manifest
+            self.document_processor.dedupe_reports = self.index_store.read_manifest(snapshot.generation).get("ingest_reports", [])
+        self._seeded = True
+    
+    def _swap(self, snapshot: IndexSnapshot):
+        # Single reference swap: in-flight queries finish on the snapshot they started with
+        with self._swap_lock:
+            self.embeddings.snapshot = snapshot
+            self.retriever = self.embeddings.get_retriever({"k": 5})
+            self.generation = snapshot.generation
+            self.initialized = True
+    
+    def rebuild(self, new_documents: List[Document] = None, background: bool = True, replaced_sources: List[str] = None,
+                replaced_chunks: List[str] = None) -> bool:
+        if self.role == "reader":
+            logger.error("Reader workers cannot rebuild the index")
+            return False
+        
+        if not background:
+            return self._build(new_documents or [], set(replaced_sources or []), set(replaced_chunks or []))
+        
+        with self._pending_lock:
+            # A source uploaded again before its build ran replaces its queued chunks, so the last version wins;
+            # so do chunks a newer revision of the same text superseded
+            sources = set(replaced_sources or [])
+            chunks = set(replaced_chunks or [])
+            self._pending_documents = [
+                doc for doc in self._pending_documents
+                if doc.metadata.get("source") not in sources and chunk_key(doc) not in chunks
+            ]
+            self._pending_documents.extend(new_documents or [])
+            self._pending_sources.update(sources)
+            self._pending_chunks.update(chunks)
+            if self._rebuild_thread is None:
+                self._rebuild_thread = threading.Thread(target=self._rebuild_worker, daemon=True)
+                self._rebuild_thread.start()
+        return True
+    
+    def is_rebuilding(self) -> bool:
+        return self._rebuild_thread is not None
+    
+    def _rebuild_worker(self):
+        while True:
+            # Documents queued while a build runs are folded into the next generation
+            with self._pending_lock:
+                new_documents = self._pending_documents
+                replaced_sources = self._pending_sources
+                replaced_chunks = self._pending_chunks
+                self._pending_documents = []
+                self._pending_sources = set()
+                self._pending_chunks = set()
+                if not new_documents and not replaced_sources and not replaced_chunks:
+                    self._rebuild_thread = None
+                    return
+            
+            self._build(new_documents, replaced_sources, replaced_chunks)
+    
+    def _build(self, new_documents: List[Document], replaced_sources: set, replaced_chunks: set) -> bool:
+        with self._build_lock:
+            if self._build_generation(new_documents, replaced_sources, replaced_chunks):
+                return True
+        
+        # The failed batch was registered at ingest; forget it so re-uploading the same file indexes it
+        self._resync_document_processor()
+        return False
+    
+    def _resync_document_processor(self):
+        # Rebuilds file hashes and dedupe entries from the served generation plus the chunks still queued
+        with self._ingest_lock:
+            with self._pending_lock:
+                pending = list(self._pending_documents)
+                queued_sources = set(self._pending_sources)
+                queued_chunks = set(self._pending_chunks)
+            
+            snapshot = self.embeddings.snapshot
+            indexed = [snapshot.get_document(i) for i in range(len(snapshot))] if snapshot is not None else []
+            duplicates = snapshot.get_duplicates() if snapshot is not None else []
+            duplicates += self.document_processor.deduplicator.linked_documents({chunk_key(doc) for doc in pending})
+            self.document_processor.reset_indexed_chunks(
+                [
+                    doc for doc in indexed
+                    if doc.metadata.get("source") not in queued_sources and chunk_key(doc) not in queued_chunks
+                ] + pending,
+                duplicates
+            )
+    
+    def _build_generation(self, new_documents: List[Document], replaced_sources: set = None, replaced_chunks: set = None) -> bool:
+        generation = None
+        try:
+            with self.index_store.lock("build"):
+                documents, vectors = self._base_generation()
+                
+                # Chunk text that is already indexed keeps its vector, including chunks of the sources being replaced
+                indexed = {self._text_key(doc): i for i, doc in enumerate(documents)}
+                missing = [doc for doc in new_documents if self._text_key(doc) not in indexed]
+                embedded = self.embeddings.embed_documents(missing) if missing else []
+                embedded = {self._text_key(doc): vector for doc, vector in zip(missing, embedded)}
+                new_vectors = [
+                    vectors[indexed[key]] if key in indexed else embedded[key]
+                    for key in (self._text_key(doc) for doc in new_documents)
+                ]
+                if new_documents:
+                    logger.info(f"Embedded {len(missing)} new chunks, reused vectors for {len(new_documents) - len(missing)}")
+                
+                # Re-uploaded sources replace their previous chunks, even when none of their new chunks survived dedupe,
+                # and chunks superseded by a newer revision of the same text make way for it
+                replaced_sources = set(replaced_sources or ())
+                replaced_chunks = set(replaced_chunks or ())
+                keep = [
+                    i for i, doc in enumerate(documents)
+                    if doc.metadata.get("source") not in replaced_sources and chunk_key(doc) not in replaced_chunks
+                ]
+                documents = [documents[i] for i in keep] + list(new_documents)
+                
+                # Chunks from generations built before metadata tagging get tagged now
+                for doc in documents:
+                    if "category" not in doc.metadata:
+                        self.document_processor.tag_metadata(doc)
+                vectors = [vectors[i] for i in keep] + new_vectors
+                
+                # Copies dedupe dropped are stored with the generation, so a restart can still bring them back
+                with self._ingest_lock:
+                    duplicates = [
+                        Document(page_content=doc.page_content, metadata=dict(doc.metadata))
+                        for doc in self.document_processor.deduplicator.linked_documents({chunk_key(doc) for doc in documents})
+                    ]
+                
+                generation, path = self.index_store.create_generation()
+                self.index_store.write_snapshot(path, documents, vectors, duplicates)
+                snapshot = IndexSnapshot(path)
+                
+                if not self._validate_generation(snapshot, documents, vectors):
+                    logger.error(f"Index generation {generation} failed validation, keeping {self.generation}")
+                    return False
+                
+                self.index_store.finalize(path, {
+                    "generation": generation,
+                    "document_count": len(documents),
+                    "sources": sorted({doc.metadata.get("source", "Unknown") for doc in documents}),
+                    "ingest_reports": list(self.document_processor.dedupe_reports),
+                    "created_at": time.time()
+                })
+                
+                self._swap(snapshot)
+                self.index_store.activate(generation)
+                self.index_store.garbage_collect(keep=self.keep_generations)
+                
+                logger.info(f"Index generation {generation} built with {len(documents)} chunks")
+                return True
+            
+        except Exception as e:
+            logger.error(f"Error building index generation {generation}: {e}")
+            return False
+    
+    @staticmethod
+    def _text_key(doc: Document) -> str:
+        return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+    
+    def _base_generation(self) -> tuple:
+        # Start from the active generation so existing chunks are never re-embedded
+        snapshot = self.index_store.open_current()
+        if snapshot is not None:
+            documents = [snapshot.get_document(i) for i in range(len(snapshot))]
+            return documents, [row for row in snapshot.vectors]
+        
+        # Carry over a pre-generation Chroma store left by older versions, then let go of its client
+        if self.embeddings.load_vector_store():
+            documents, vectors = self.embeddings.export_vectors()
+            self.embeddings.vector_store = None
+            logger.info(f"Migrating {len(documents)} chunks from {self.embeddings.vector_store_path}")
+            return documents, vectors
+        
+        return [], []
+    
+    def _validate_generation(self, snapshot: IndexSnapshot, documents: List[Document], vectors: List[List[float]]) -> bool:
+        if not documents:
+            logger.error("Refusing to build an empty index generation")
+            return False
+        
+        count = len(snapshot)
+        if count != len(documents):
+            logger.error(f"Index generation has {count} chunks, expected {len(documents)}")
+            return False
+        
+        # Sample queries: each probe chunk must come back as its own nearest neighbour
+        for i in sorted({0, len(documents) // 2, len(documents) - 1}):
+            results = snapshot.search(vectors[i], k=1)
+            if not results or results[0][0].page_content != documents[i].page_content:
+                logger.error(f"Sample query {i} did not return its own chunk")
+                return False
+        
+        return True
+    
+    def rollback(self) -> bool:
+        if self.role == "reader":
+            logger.error("Reader workers cannot roll back the index")
+            return False
+        
+        with self._build_lock, self.index_store.lock("build"):
+            if self.index_store.rollback() is None:
+                return False
+            if not self._load_current_generation():
+                return False
+        
+        # Files indexed only in the generation rolled away from must count as new again
+        self._resync_document_processor()
+        return True
+    
+    def follow_current(self) -> bool:
+        # `indexer.py rollback` flips CURRENT from another process; a running writer adopts it before ingesting more
+        with self._build_lock:
+            generation = self.index_store.current_generation()
+            if generation is None or generation == self.generation or not self._load_current_generation():
+                return False
+        
+        logger.info(f"Following externally activated index generation {generation}")
+        self._resync_document_processor()
+        return True
+    
+    def corpus_version(self) -> str:
+        # Cheap check for the extractive index; get_corpus copies every chunk out of the snapshot
+        snapshot = self.embeddings.snapshot
+        if snapshot is not None:
+            return snapshot.generation
+        
+        if self.document_processor is not None:
+            return f"processed-{len(self.document_processor.get_processed_documents())}"
+        
+        return None
+    
+    def list_documents(self) -> List[Dict[str, Any]]:
+        # Sources of the generation being served, so every worker lists the same documents
+        snapshot = self.embeddings.active_snapshot()
+        if snapshot is None:
+            return self.document_processor.list_documents() if self.document_processor is not None else []
+        
+        return [
+            {
+                "source": source,
+                "document_type": snapshot.get_document(int(ids[0])).metadata.get("document_type", "Unknown"),
+                "chunks": len(ids)
+            }
+            for source, ids in sorted(snapshot.partitions.get("source", {}).items())
+        ]
+    
+    def get_ingest_reports(self) -> List[Dict[str, Any]]:
+        if self.document_processor is not None:
+            return self.document_processor.dedupe_reports
+        
+        # Readers never ingest; they show what the writer recorded with the generation they serve
+        snapshot = self.embeddings.active_snapshot()
+        if snapshot is None:
+            return []
+        return self.index_store.read_manifest(snapshot.generation).get("ingest_reports", [])
+    
+    def get_corpus(self) -> tuple:
+        # (version, chunks) of the corpus currently being served, for LLM-free answering
+        snapshot = self.embeddings.snapshot
+        if snapshot is not None:
+            return snapshot.generation, [snapshot.get_document(i) for i in range(len(snapshot))]
+        
+        if self.document_processor is not None:
+            documents = self.document_processor.get_processed_documents()
+            return f"processed-{len(documents)}", documents
+        
+        return None, []
+    
+    def validate_filters(self, filters: Dict[str, str] = None) -> Dict[str, str]:
+        if not filters:
+            return {}
+        
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unsupported filter fields: {', '.join(sorted(unknown))}")
+        
+        # Tags are stored lower-case, except source paths
+        return {
+            field: str(value) if field == "source" else str(value).lower()
+            for field, value in filters.items() if value
+        }
+    
+    def retrieve_adaptive(self, query: str, mode: str = "standard", filters: Dict[str, str] = None, k: int = None) -> List[tuple]:
+        # An explicit k is always honored as-is
+        filters = self.validate_filters(filters)
+        if k is not None:
+            return self.embeddings.similarity_search_with_score(query, k=k, filters=filters)
+        
+        min_k, max_k = self._depth(mode)
+        results = self.embeddings.similarity_search_with_score(query, k=max_k, filters=filters)
+        if not self.adaptive:
+            return results
+        
+        scores = [float(score) for _, score in results]
+        chosen, reason = adaptive_depth(scores, min_k, max_k, self.max_distance, self.max_gap)
+        self._record_depth(mode, chosen, reason, scores)
+        logger.debug(f"Retrieval depth {chosen}/{len(results)} for {mode} mode ({reason}), scores {[round(score, 3) for score in scores]}")
+        return results[:chosen]
+    
+    def retrieve_incremental(self, query: str, mode: str = "standard", filters: Dict[str, str] = None,
+                             cached: Dict[int, Document] = None, generation: str = None) -> tuple:
+        # For sessions: chunks the session already holds (snapshot row -> chunk) are scored locally, and the
+        # index is only searched for the ones still missing. Returns (generation, [(row, chunk, score)], searched)
+        snapshot = self.embeddings.active_snapshot()
+        if snapshot is None:
+            return None, [(None, doc, score) for doc, score in self.retrieve_adaptive(query, mode, filters)], True
+        
+        filters = self.validate_filters(filters)
+        min_k, max_k = self._depth(mode)
+        query_vector = self.embeddings.embed_query(query)
+        
+        # Rows only identify chunks within the generation they came from
+        cached = cached if cached and generation == snapshot.generation else {}
+        if cached and filters:
+            allowed = set(snapshot.partition_ids(filters).tolist())
+            cached = {row: doc for row, doc in cached.items() if row in allowed}
+        held = sorted(zip(cached, snapshot.distances(query_vector, list(cached))), key=lambda item: item[1])
+        held = [(row, score) for row, score in held if score <= self.max_distance][:max_k]
+        
+        # Enough close chunks already in the session: no search at all
+        missing = max_k - len(held) if not self.adaptive or len(held) < min_k else 0
+        fetched = []
+        if missing:
+            with get_tracer().span("vector_search", backend="snapshot", generation=snapshot.generation,
+                                   k=missing, excluded=len(cached), filters=sorted(filters)) as span:
+                fetched = snapshot.search_rows(query_vector, missing, filters, exclude=set(cached))
+                span.set(results=len(fetched), scores=[round(score, 4) for _, score in fetched])
+        
+        results = sorted(held + fetched, key=lambda item: item[1])
+        if self.adaptive:
+            scores = [score for _, score in results]
+            chosen, reason = adaptive_depth(scores, min_k, max_k, self.max_distance, self.max_gap)
+            self._record_depth(mode, chosen, reason, scores)
+            logger.debug(f"Session retrieval depth {chosen} for {mode} mode ({reason}), {len(held)} held, {len(fetched)} fetched")
+            results = results[:chosen]
+        
+        return snapshot.generation, [
+            (row, cached[row] if row in cached else snapshot.get_document(row), score) for row, score in results
+        ], bool(missing)
+    
+    def _depth(self, mode: str) -> tuple:
+        depth = self.depths.get(mode) or self.depths["standard"]
+        return int(depth.get("min_k", 1)), int(depth.get("max_k", 5))
+    
+    def _record_depth(self, mode: str, depth: int, reason: str, scores: List[float]):
+        with self._stats_lock:
+            stats = self.depth_stats.setdefault(mode, {"requests": 0, "depths": {}, "cut_by": {}, "kept": {}, "cut": {}})
+            stats["requests"] += 1
+            stats["depths"][depth] = stats["depths"].get(depth, 0) + 1
+            stats["cut_by"][reason] = stats["cut_by"].get(reason, 0) + 1
+            # Where the kept and the cut chunks score shows whether max_distance and the gap sit in the right place
+            for i, score in enumerate(scores):
+                histogram = stats["kept"] if i < depth else stats["cut"]
+                bucket = score_bucket(score)
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+    
+    def get_retrieval_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            modes = {
+                mode: {
+                    **self.depths.get(mode, {}),
+                    "requests": stats["requests"],
+                    "mean_depth": round(sum(depth * count for depth, count in stats["depths"].items()) / stats["requests"], 2),
+                    "depths": {str(depth): count for depth, count in sorted(stats["depths"].items())},
+                    "cut_by": dict(stats["cut_by"]),
+                    "scores": {
+                        outcome: {f"<={bound}": stats[outcome][bound] for bound in SCORE_BUCKETS if stats[outcome].get(bound)}
+                        for outcome in ("kept", "cut")
+                    }
+                }
+                for mode, stats in self.depth_stats.items()
+            }
+        return {"adaptive": self.adaptive, "max_distance": self.max_distance, "score_gap": self.max_gap, "modes": modes}
+    
+    def retrieve_documents(self, query: str, k: int = None, filters: Dict[str, str] = None, mode: str = "standard") -> List[Dict[str, Any]]:
         try:
             if not self.initialized or self.retriever is None:
                 logger.error("Retriever not initialized")
                 return []
             
             # Get relevant documents
-            docs = self.retriever.get_relevant_documents(query)
+            docs = [doc for doc, _ in self.retrieve_adaptive(query, mode, filters, k)]
             
             # Format results
             results = []
@@ -85,24 +574,25 @@ class HealthcareRetriever:
                 results.append({
                     "content": doc.page_content,
                     "source": doc.metadata.get("source", "Unknown"),
-                    "document_type": doc.metadata.get("document_type", "Unknown")
+                    "document_type": doc.metadata.get("document_type", "Unknown"),
+                    "category": doc.metadata.get("category", "general")
                 })
             
-            logger.info(f"Retrieved {len(results)} documents for query: {query}")
+            logger.debug(f"Retrieved {len(results)} documents")
             return results
             
         except Exception as e:
             logger.error(f"Error retrieving documents: {e}")
             return []
     
-    def retrieve_with_scores(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+    def retrieve_with_scores(self, query: str, k: int = None, filters: Dict[str, str] = None, mode: str = "standard") -> List[Dict[str, Any]]:
         try:
             if not self.initialized:
                 logger.error("Retriever not initialized")
                 return []
             
             # Get documents with scores
-            docs_with_scores = self.embeddings.similarity_search_with_score(query, k=k)
+            docs_with_scores = self.retrieve_adaptive(query, mode, filters, k)
             
             # Format results
             results = []
@@ -111,29 +601,41 @@ class HealthcareRetriever:
                     "content": doc.page_content,
                     "source": doc.metadata.get("source", "Unknown"),
                     "document_type": doc.metadata.get("document_type", "Unknown"),
+                    "category": doc.metadata.get("category", "general"),
                     "similarity_score": float(score)
                 })
             
-            logger.info(f"Retrieved {len(results)} documents with scores for query: {query}")
+            logger.debug(f"Retrieved {len(results)} documents with scores")
             return results
             
         except Exception as e:
             logger.error(f"Error retrieving documents with scores: {e}")
             return []
     
-    def add_document(self, file_path: str) -> bool:
+    def add_document(self, file_path: str, metadata: Dict[str, str] = None) -> bool:
         try:
-            # Process the new document
-            if self.document_processor.process_document(file_path):
-                # Get the new document chunks
-                new_documents = self.document_processor.get_processed_documents()
-                
-                # Add to vector store
-                if self.embeddings.add_documents(new_documents):
-                    # Update retriever
-                    self.retriever = self.embeddings.get_retriever({"k": 5})
-                    logger.info(f"Added document {file_path} to retriever")
-                    return True
+            if self.role == "reader":
+                logger.error("Reader workers cannot ingest documents; queue them for the writer")
+                return False
+            
+            with self._ingest_lock:
+                # Process the new document
+                if self.document_processor.process_document(file_path, metadata):
+                    if self.document_processor.last_report["unchanged"]:
+                        logger.info(f"Document {file_path} is unchanged, index left as is")
+                        return True
+                    
+                    # Get the new document chunks, plus copies from other documents it no longer duplicates
+                    source = self.document_processor.last_report["source"]
+                    changes = self.document_processor.last_changes
+                    new_documents = changes["documents"]
+                    if not any(doc.metadata.get("source") == source for doc in new_documents):
+                        logger.info(f"Document {file_path} only contained duplicate chunks, dropping its previous chunks")
+                    
+                    # Build the next generation in the background and swap it in when validated
+                    if self.rebuild(new_documents, replaced_sources=[source], replaced_chunks=changes["replaced_chunks"]):
+                        logger.info(f"Queued document {file_path} for the next index generation")
+                        return True
             
             return False
             
@@ -143,13 +645,9 @@ class HealthcareRetriever:
     
     def search_by_category(self, query: str, category: str = None) -> List[Dict[str, Any]]:
         try:
-            # Modify query based on category
-            if category:
-                enhanced_query = f"{category} {query}"
-            else:
-                enhanced_query = query
-            
-            return self.retrieve_documents(enhanced_query)
+            # Only the category's partition is searched
+            filters = {"category": category} if category else None
+            return self.retrieve_documents(query, filters=filters)
             
         except Exception as e:
             logger.error(f"Error searching by category: {e}")
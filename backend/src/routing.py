@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+
+from resilience import LatencyTracker, SaturatedError, remaining_budget
+from tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# Ordered cheapest to largest; override with MODEL_TIERS (JSON with the same shape).
+# "overflow" lets a full tier hand requests to the next one, so only fast spills into standard by default
+DEFAULT_MODEL_TIERS = {
+    "fast": {"model": "gpt-4.1-nano", "max_concurrency": 32, "overflow": True},
+    "standard": {"model": "gpt-4.1-mini", "max_concurrency": 16},
+    "large": {"model": "gpt-4.1", "max_concurrency": 4},
+}
+
+COMPLEX_CUES = re.compile(
+    r"\b(why|how does|how do|explain|compare|difference|versus|vs|workflow|process|regulat\w*|"
+    r"complian\w*|requirement\w*|appeal\w*|audit\w*|reimburse\w*|exception\w*|impact)\b"
+)
+ACRONYM = re.compile(r"\b[A-Z][A-Z0-9\-]{1,}\b")
+
+class TierSaturated(SaturatedError):
+    pass
+
+class TokenUsageHandler(BaseCallbackHandler):
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+
+class ModelTier:
+    def __init__(self, name: str, model: str, max_concurrency: int, llm: Any, overflow: bool = False):
+        self.name = name
+        self.model = model
+        self.llm = llm
+        self.overflow = overflow
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.latency = LatencyTracker()
+        self.stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "overflowed": 0, "saturated": 0}
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, usage: TokenUsageHandler):
+        self.latency.record(seconds)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += usage.prompt_tokens
+            self.stats["completion_tokens"] += usage.completion_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "overflow": self.overflow,
+            **self.stats,
+            "p50": round(self.latency.percentile(0.5), 4),
+            "p95": round(self.latency.percentile(0.95), 4)
+        }
+
+def complexity_score(question: str) -> int:
+    words = len(question.split())
+    score = 0
+    if words > 12:
+        score += 1
+    if words > 30:
+        score += 1
+    score += min(2, len(COMPLEX_CUES.findall(question.lower())))
+    if question.count("?") > 1 or len(set(ACRONYM.findall(question))) > 2:
+        score += 1
+    return score
+
+class ModelRouter:
+    def __init__(self, llm_factory: Callable[[str], Any], default_model: str = None):
+        override = json.loads(os.getenv("MODEL_TIERS", "null"))
+        config = override or DEFAULT_MODEL_TIERS
+        if default_model and not override:
+            # Without MODEL_TIERS, the chain's model_name keeps pointing the cheapest tier at that model
+            first = next(iter(config))
+            config = {**config, first: {**config[first], "model": default_model}}
+
+        self.tiers = {
+            name: ModelTier(
+                name, tier["model"], int(tier.get("max_concurrency", 8)), llm_factory(tier["model"]), bool(tier.get("overflow", False))
+            )
+            for name, tier in config.items()
+        }
+        self.tier_order = list(self.tiers)
+        self.large_context_chars = int(os.getenv("ROUTER_LARGE_CONTEXT_CHARS", "6000"))
+        self.max_slot_wait = float(os.getenv("ROUTER_MAX_SLOT_WAIT_SECONDS", "2"))
+
+    def _tier(self, level: int) -> ModelTier:
+        return self.tiers[self.tier_order[max(0, min(level, len(self.tier_order) - 1))]]
+
+    def route(self, mode: str, question: str, documents: List[Document]) -> ModelTier:
+        score = complexity_score(question)
+        context_chars = sum(len(doc.page_content) for doc in documents)
+
+        # Definitions and beginner answers stay on the cheap tier unless clearly hard
+        if mode in ("glossary", "simple"):
+            level = 1 if score >= 3 else 0
+        elif mode == "technical":
+            level = 2 if score >= 3 or context_chars > self.large_context_chars else 1
+        elif mode == "compare":
+            level = 1
+        else:
+            level = 0 if score <= 1 else 1 if score <= 3 else 2
+
+        if context_chars > self.large_context_chars:
+            level = max(level, 1)
+
+        tier = self._tier(level)
+        logger.debug(f"Routed {mode} request to {tier.name} (complexity {score}, context {context_chars} chars)")
+        return tier
+
+    def _acquire(self, tier: ModelTier, timeout: float) -> ModelTier:
+        # A full tier overflows to the next larger one before queueing, for as long as the tiers along the way opted in
+        for name in self.tier_order[self.tier_order.index(tier.name):]:
+            candidate = self.tiers[name]
+            if candidate.slots.acquire(blocking=False):
+                if candidate is not tier:
+                    with tier._lock:
+                        tier.stats["overflowed"] += 1
+                return candidate
+            if not candidate.overflow:
+                break
+
+        # Only part of the budget is spent queueing, so saturation is reported before the call times out
+        if tier.slots.acquire(timeout=max(0.0, min(self.max_slot_wait, timeout / 2))):
+            return tier
+        with tier._lock:
+            tier.stats["saturated"] += 1
+        raise TierSaturated(f"Model tier {tier.name} is saturated")
+
+    def generate(self, tier: ModelTier, chain_factory: Callable[[Any], Any], inputs: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        tier = self._acquire(tier, timeout)
+        try:
+            # The request only gets what is left of the attempt, so an abandoned attempt frees its thread in time
+            request_timeout = remaining_budget()
+            if request_timeout is not None and request_timeout <= 0:
+                raise TimeoutError(f"No budget left for the {tier.name} tier")
+            llm = tier.llm.bind(timeout=request_timeout) if request_timeout is not None else tier.llm
+
+            with get_tracer().span("llm_call", tier=tier.name, model=tier.model) as span:
+                usage = TokenUsageHandler()
+                started = time.monotonic()
+                result = chain_factory(llm).invoke(inputs, config={"callbacks": [usage]})
+                tier.record(time.monotonic() - started, usage)
+                span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            return result
+        finally:
+            tier.slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {name: tier.get_stats() for name, tier in self.tiers.items()}
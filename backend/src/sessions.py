@@ -0,0 +1,167 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_\-]{8,64}$")
+
+class Session:
+    def __init__(self, session_id: str, max_turns: int, max_chunks: int, store: "SessionStore" = None):
+        self.session_id = session_id
+        # Size changes are reported to the store while the session is still held by it
+        self.store = store
+        self.turns = deque(maxlen=max_turns)
+        # Retrieved chunks keyed by their row in the index generation they came from
+        self.generation = None
+        self.chunks = OrderedDict()
+        self.max_chunks = max_chunks
+        self.last_used = time.monotonic()
+        self.size = 0
+        self.stats = {"reused_chunks": 0, "fetched_chunks": 0, "searches_skipped": 0}
+        self._lock = threading.Lock()
+
+    def retrieval_query(self, question: str) -> str:
+        # Short follow-ups ("what about Level II?") are searched together with the previous question
+        if not self.turns:
+            return question
+        return f"{self.turns[-1]['question']} {question}"
+
+    def prompt_question(self, question: str, answer_chars: int = 200) -> str:
+        # Only the stored turns (SESSION_MAX_TURNS) go into the prompt, each answer cut short, so it stops growing
+        if not self.turns:
+            return question
+        history = "\n".join(
+            f"User: {turn['question']}\nAssistant: {turn['answer'][:answer_chars]}" for turn in self.turns
+        )
+        return f"Conversation so far:\n{history}\n\nFollow-up question: {question}"
+    
+    def cached_chunks(self) -> Tuple[Optional[str], Dict[int, Document]]:
+        with self._lock:
+            return self.generation, dict(self.chunks)
+    
+    def add_chunks(self, generation: Optional[str], results: List[tuple], searched: bool):
+        # results are (row, chunk, score) from HealthcareRetriever.retrieve_incremental
+        with self._lock:
+            if generation != self.generation:
+                # A new index generation renumbers rows, so chunks from the old one cannot be matched
+                for doc in self.chunks.values():
+                    self._resize(-len(doc.page_content))
+                self.chunks.clear()
+                self.generation = generation
+            
+            if not searched:
+                self.stats["searches_skipped"] += 1
+            for row, doc, _ in results:
+                if row is None:
+                    continue
+                if row in self.chunks:
+                    self.chunks.move_to_end(row)
+                    self.stats["reused_chunks"] += 1
+                    continue
+                self.chunks[row] = doc
+                self._resize(len(doc.page_content))
+                self.stats["fetched_chunks"] += 1
+            
+            while len(self.chunks) > self.max_chunks:
+                _, evicted = self.chunks.popitem(last=False)
+                self._resize(-len(evicted.page_content))
+    
+    def add_turn(self, question: str, answer: str):
+        with self._lock:
+            if len(self.turns) == self.turns.maxlen:
+                oldest = self.turns[0]
+                self._resize(-(len(oldest["question"]) + len(oldest["answer"])))
+            self.turns.append({"question": question, "answer": answer})
+            self._resize(len(question) + len(answer))
+
+    def _resize(self, delta: int):
+        self.size += delta
+        store = self.store
+        if store is not None:
+            store._account(delta)
+
+class SessionStore:
+    # In-process: with several query workers, route each session to one worker (sticky sessions)
+    def __init__(self, ttl: float = None, max_sessions: int = None, max_bytes: int = None,
+                 max_turns: int = None, max_chunks: int = None):
+        self.ttl = ttl or float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_MAX_COUNT", "10000"))
+        # Approximate: characters of stored turns and chunk text across all sessions
+        self.max_bytes = max_bytes or int(os.getenv("SESSION_MAX_BYTES", str(64 * 2 ** 20)))
+        self.max_turns = max_turns or int(os.getenv("SESSION_MAX_TURNS", "2"))
+        self.max_chunks = max_chunks or int(os.getenv("SESSION_MAX_CHUNKS", "20"))
+        self.sessions = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"created": 0, "expired": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._bytes_lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Session]:
+        if not session_id:
+            return None
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError("session_id must be 8-64 letters, digits, '-' or '_'")
+
+        with self._lock:
+            self._expire()
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.max_turns, self.max_chunks, store=self)
+                self.sessions[session_id] = session
+                self.stats["created"] += 1
+            else:
+                self.sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            self._enforce_limits()
+            return session
+
+    def end(self, session_id: str) -> bool:
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                self._detach(session)
+            return session is not None
+
+    def _account(self, delta: int):
+        with self._bytes_lock:
+            self.total_bytes += delta
+
+    def _detach(self, session: Session):
+        session.store = None
+        self._account(-session.size)
+
+    def _expire(self):
+        # Sessions are kept in least-recently-used order, so expired ones sit at the front
+        cutoff = time.monotonic() - self.ttl
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_used > cutoff:
+                break
+            self.sessions.popitem(last=False)
+            self._detach(session)
+            self.stats["expired"] += 1
+
+    def _enforce_limits(self):
+        # The least recently used conversations go first once either cap is exceeded
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self.total_bytes > self.max_bytes):
+            _, session = self.sessions.popitem(last=False)
+            self._detach(session)
+            self.stats["evicted"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            sessions = list(self.sessions.values())
+        return {
+            **self.stats,
+            "active": len(sessions),
+            "approx_bytes": self.total_bytes,
+            **{key: sum(session.stats[key] for session in sessions) for key in ("reused_chunks", "fetched_chunks", "searches_skipped")}
+        }
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    def __init__(self, name: str, trace: "Trace", parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class _NoopSpan:
+    # Handed out for unsampled requests so call sites never branch on sampling
+    trace = None
+
+    def set(self, **attributes):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    def __init__(self, exporter):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.exporter = exporter
+        self.spans = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            if not self.closed:
+                self.spans.append(span)
+                return
+        # Spans that end after the request returned (e.g. a losing hedge still in flight) are exported on their own
+        span.attributes["late"] = True
+        self.exporter.export([span])
+
+    def close(self) -> List[Span]:
+        with self._lock:
+            self.closed = True
+            return self.spans
+
+class JsonlExporter:
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        # File writes happen on a listener thread, never on the request path
+        self.queue = queue.Queue(maxsize=10000)
+        self.listener = logging.handlers.QueueListener(self.queue, handler)
+        self.listener.start()
+
+    def export(self, spans: List[Span]):
+        for span in spans:
+            record = logging.LogRecord("trace", logging.INFO, "", 0, json.dumps(span.to_dict(), default=str), None, None)
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                return
+
+class OtlpExporter:
+    def __init__(self, endpoint: str, batch_size: int = 256, interval: float = 2.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=10000)
+        self.client = httpx.Client(timeout=5.0)
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+
+    def export(self, spans: List[Span]):
+        for span in spans:
+            try:
+                self.queue.put_nowait(span)
+            except queue.Full:
+                return
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            flush_at = time.monotonic() + self.interval
+            while len(batch) < self.batch_size and time.monotonic() < flush_at:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, flush_at - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.client.post(self.url, json=self._payload(batch)).raise_for_status()
+            except Exception as e:
+                logger.warning(f"Dropped {len(batch)} spans, OTLP export failed: {e}")
+
+    @staticmethod
+    def _value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": value if isinstance(value, str) else json.dumps(value, default=str)}
+
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        # OTLP/HTTP JSON encoding, accepted by the OpenTelemetry collector and most tracing backends
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "healthcare-explainer"}}]},
+            "scopeSpans": [{"scope": {"name": "healthcare-explainer"}, "spans": [{
+                "traceId": span.trace.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 2 if span.parent_id is None else 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": key, "value": self._value(value)} for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+            } for span in spans]}]
+        }]}
+
+class Tracer:
+    def __init__(self):
+        # Head sampling: the keep/drop decision is made once per request, at its root span
+        self.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+        exporter = os.getenv("TRACE_EXPORTER", "jsonl")
+        if exporter == "otlp":
+            self.exporter = OtlpExporter(os.getenv("OTLP_ENDPOINT", "http://localhost:4318"))
+        elif exporter == "jsonl":
+            # Rotation is not safe across processes, so each worker writes its own file
+            self.exporter = JsonlExporter(
+                os.getenv("TRACE_FILE", "../data/traces/traces-{pid}.jsonl").replace("{pid}", str(os.getpid())),
+                max_bytes=int(os.getenv("TRACE_MAX_BYTES", str(10 * 2 ** 20))),
+                backups=int(os.getenv("TRACE_BACKUPS", "5"))
+            )
+        else:
+            self.exporter = None
+        self.stats = {"traces": 0, "sampled": 0}
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        self.stats["traces"] += 1
+        if self.exporter is None or random.random() >= self.sample_rate:
+            token = _current_span.set(None)
+            try:
+                yield NOOP_SPAN
+            finally:
+                _current_span.reset(token)
+            return
+
+        self.stats["sampled"] += 1
+        trace = Trace(self.exporter)
+        try:
+            with self._span(name, trace, None, attributes) as root:
+                yield root
+        finally:
+            self.exporter.export(trace.close())
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        with self._span(name, parent.trace, parent.span_id, attributes) as span:
+            yield span
+
+    @contextmanager
+    def _span(self, name: str, trace: Trace, parent_id: Optional[str], attributes: Dict[str, Any]):
+        span = Span(name, trace, parent_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            trace.add(span)
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    # Created on first use so batch tools that never trace do not open trace files
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
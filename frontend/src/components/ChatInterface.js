@@ -46,6 +46,12 @@ const ChatInterface = () => {
   const [mode, setMode] = useState('standard');
   const [expandedSources, setExpandedSources] = useState({});
   const messagesEndRef = useRef(null);
+  // One server-side session per conversation, so follow-up questions keep their context
+  const sessionIdRef = useRef(
+    window.crypto?.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  );
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -69,7 +75,7 @@ const ChatInterface = () => {
     setIsLoading(true);
 
     try {
-      const response = await askQuestion(inputMessage, mode);
+      const response = await askQuestion(inputMessage, mode, null, sessionIdRef.current);
 
       const botMessage = {
         type: 'bot',
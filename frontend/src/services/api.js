@@ -31,11 +31,13 @@ export const initializeSystem = async () => {
 };
 
 // Ask a question
-export const askQuestion = async (question, mode = 'standard') => {
+export const askQuestion = async (question, mode = 'standard', filters = null, sessionId = null) => {
   try {
     const response = await api.post('/ask', {
       question,
       mode,
+      filters,
+      session_id: sessionId,
     });
     return response.data;
   } catch (error) {